@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os;
+import sys
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -27,12 +28,6 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
-REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-    ],
-}
-
 # Application definition
 
 INSTALLED_APPS = [
@@ -42,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'drf_spectacular',
@@ -55,8 +51,10 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.uploads.UploadLimitMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,18 +83,116 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are kept between requests instead of opened for each one:
+# by default every thread keeps its own for DB_CONN_MAX_AGE seconds
+# (0 closes it after each request). With DB_POOL=1 the threads of a
+# process share up to DB_POOL_MAX_SIZE connections instead, which suits
+# threaded servers with more threads than busy connections.
+DB_POOL = bool(int(os.environ.get('DB_POOL', 0)))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django.db.backends.postgresql with health checks and pooling
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
         'PORT': '5432',  # New port
+        # a pooled connection goes back to the pool after each request
+        'CONN_MAX_AGE': 0 if DB_POOL else int(
+            os.environ.get('DB_CONN_MAX_AGE', 60)
+        ),
+        # reused connections are checked before their first query in a
+        # request, so one closed by a database restart is replaced
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # seconds a request waits for a connection when all are in use
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # seconds an unused connection is kept open
+            'MAX_IDLE': int(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        } if DB_POOL else None,
+    }
+}
 
+# Read replicas, comma separated hosts of the same database. Safe requests
+# to the recipe APIs read from one of them, see core.db.routers.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1,
+):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# A second local database standing in for a replica in the tests. Unlike
+# a mirror it holds rows of its own, so a test can tell where a read went;
+# reads only go to it in tests that add it to DATABASE_REPLICAS.
+if os.environ.get('DB_TEST_REPLICA'):
+    DATABASES['test_replica'] = {
+        **DATABASES['default'],
+        'TEST': {'NAME': f"test_{DATABASES['default']['NAME']}_replica"},
+    }
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, longer
+# than the replicas lag behind it
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 10)
+)
+
+# Cache for per-user API responses. It also holds the version counters
+# that expire them, their ETags and the in-process indexes, and the
+# replica pins, so every web and job worker process has to share it:
+# Memcached unless configured.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.memcached.PyMemcacheCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', '127.0.0.1:11211'),
     }
 }
+if sys.argv[1:2] == ['test']:
+    # the tests run in one process and share nothing with a server
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
 
+# Seconds a cached list response is kept, 0 disables the cache
+RECIPE_LIST_CACHE_TIMEOUT = int(
+    os.environ.get('RECIPE_LIST_CACHE_TIMEOUT', 300)
+)
+
+# Users whose recipe indexes are kept in each process
+RECIPE_INDEX_SIZE = int(
+    os.environ.get('RECIPE_INDEX_SIZE', 256)
+)
+
+# Render image variants in the request once it commits instead of on the
+# job queue (tests and one-off scripts)
+RECIPE_IMAGE_EAGER = bool(int(os.environ.get('RECIPE_IMAGE_EAGER', 0)))
+
+# Background job queue, see core.jobs and the run_workers command
+# worker processes started by run_workers
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# seconds a claimed job stays hidden from other workers; a job still
+# unfinished by then is run again, so it must stay longer than any job
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT', 600))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+# a failed attempt is retried after about JOB_RETRY_BACKOFF * 2 ** n
+# seconds, at most JOB_RETRY_BACKOFF_MAX
+JOB_RETRY_BACKOFF = int(os.environ.get('JOB_RETRY_BACKOFF', 10))
+JOB_RETRY_BACKOFF_MAX = int(os.environ.get('JOB_RETRY_BACKOFF_MAX', 3600))
+# seconds an idle worker waits before looking for due jobs again
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -138,6 +234,32 @@ STATIC_URL = '/static/static/'
 MEDIA_URL = '/static/media/'
 
 MEDIA_ROOT = '/vol/web/media'
+# how media files are handed to the front proxy after the permission
+# check: 'nginx' (X-Accel-Redirect to MEDIA_ACCEL_PREFIX, an internal
+# location aliased to MEDIA_ROOT), 'sendfile' (X-Sendfile) or None to
+# stream them from Django
+MEDIA_SENDFILE_BACKEND = os.environ.get('MEDIA_SENDFILE_BACKEND') or None
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# uploads are streamed to a temporary file in chunks and rejected with
+# 413 once they pass UPLOAD_MAX_BYTES, so no upload is held in memory
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.MaxSizeUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+# limits checked from the image header before anything is decoded
+IMAGE_UPLOAD_FORMATS = ['JPEG', 'PNG', 'WEBP']
+IMAGE_UPLOAD_MAX_SIDE = int(os.environ.get('IMAGE_UPLOAD_MAX_SIDE', 8000))
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)
+)
+# uploads are stored once per distinct content, see core.storage
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# seconds an unreferenced blob is kept, so an upload that resolved to it
+# can still take a reference
+MEDIA_BLOB_GRACE_SECONDS = int(
+    os.environ.get('MEDIA_BLOB_GRACE_SECONDS', 3600)
+)
 STATIC_ROOT = '/vol/web/static'
 
 # Default primary key field type
@@ -147,10 +269,23 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
+# token authentication with the token and user lookup cached
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'core.authentication.CachedTokenAuthentication',
+    ],
 # generate schema drf_spectacular packages
      'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+# answers uploads over UPLOAD_MAX_BYTES with 413
+    'EXCEPTION_HANDLER': 'core.uploads.exception_handler',
 
 }
+# in-process LRU of authenticated tokens, optionally backed by a
+# cache alias shared between workers
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 1024)),
+    'TTL': int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60)),
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None,
+}
 # setting controls how API documentation handles request and
 # response data in Django REST Framework (DRF)
 # drf-spectacular creates two separate schemas:
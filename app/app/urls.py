@@ -19,9 +19,11 @@ from drf_spectacular.views import (
 )
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import HealthView
+from recipe.media import MediaView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # generates scema for our api
@@ -36,11 +38,13 @@ urlpatterns = [
         ),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    # database check and connection pool metrics for monitoring
+    path('api/health/', HealthView.as_view(), name='health'),
+    # uploaded images, only for the owners of the recipes using them;
+    # the file itself is sent by the front proxy when one is configured
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}<path:path>',
+        MediaView.as_view(),
+        name='media',
+    ),
 ]
-
-# to serve static files by django as it does not do this by default
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT,
-    )
@@ -6,13 +6,33 @@ Django admin customization
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 # _  A shortcut for translating text in different languages.
 
+from rest_framework.authtoken.models import Token
+
 from core import models
+from core.jobs import enqueue
+from recipe.cache import bump_version
+
+
+class SoftDeleteAdminMixin:
+    """Mark rows deleted and leave the cascade to the purge jobs."""
+
+    def get_deleted_objects(self, objs, request):
+        # the confirmation page lists only the selected rows; collecting
+        # their related rows is what the soft delete avoids
+        objs = list(objs)
+        opts = self.model._meta
+        return objs, {opts.verbose_name_plural: len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
 
 
-class UserAdmin(BaseUserAdmin):  # manages the display of users in admin
+# manages the display of users in admin
+class UserAdmin(SoftDeleteAdminMixin, BaseUserAdmin):
     """Define the admin pages for users"""
 
     ordering = ['id']
@@ -47,11 +67,33 @@ class UserAdmin(BaseUserAdmin):  # manages the display of users in admin
         }),
     )
 
+    def delete_queryset(self, request, queryset):
+        """Close the accounts and queue the jobs removing their data."""
+        for user in queryset:
+            with transaction.atomic():
+                user.soft_delete()
+                Token.objects.filter(user=user).delete()
+                enqueue('core.purge_user', {'user_id': user.pk})
+
+
+class RecipeAdmin(SoftDeleteAdminMixin, admin.ModelAdmin):
+    """Define the admin pages for recipes"""
+
+    def delete_queryset(self, request, queryset):
+        """Mark the recipes deleted and queue the job removing them."""
+        recipes = dict(queryset.values_list('pk', 'user_id'))
+        with transaction.atomic():
+            models.Recipe.objects.filter(pk__in=list(recipes)).soft_delete()
+            enqueue('core.purge_recipes', {'ids': list(recipes)})
+        # soft deletes don't send model signals
+        for user_id in set(recipes.values()):
+            bump_version(user_id)
+
 
 # registers your custom User model with the UserAdmin
 # to use your UserAdmin class when displaying
 # and managing users in the admin
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
+admin.site.register(models.Recipe, RecipeAdmin)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
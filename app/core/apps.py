@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # connects the auth cache invalidation receivers
+        from core import signals  # noqa: F401
+        # registers the purge job handlers
+        from core import purge  # noqa: F401
@@ -0,0 +1,161 @@
+"""
+Authentication classes for the APIs
+"""
+import pickle
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.lru import LRUCache
+
+
+DEFAULTS = {
+    # tokens kept in each process
+    'MAX_SIZE': 1024,
+    # seconds a token stays in the process; bounds how long another
+    # worker can keep accepting a token after it was invalidated
+    'TTL': 60,
+    # alias from CACHES shared by all workers, None for process only
+    'SHARED_CACHE': None,
+    'SHARED_TTL': 300,
+}
+
+
+def cache_settings():
+    """Return TOKEN_AUTH_CACHE merged with the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+local_cache = LRUCache()
+
+
+def _shared_key(key):
+    return f'auth:token:{key}'
+
+
+def _generation_key(key):
+    return f'auth:token:generation:{key}'
+
+
+def _shared_cache():
+    alias = cache_settings()['SHARED_CACHE']
+    return caches[alias] if alias else None
+
+
+def _generation(shared, key):
+    """Return the generation of a token's shared cache entry."""
+    generation = shared.get(_generation_key(key))
+    if generation is None:
+        _start_generation(shared, key)
+        generation = shared.get(_generation_key(key))
+    return generation
+
+
+def _start_generation(shared, key):
+    # a fresh counter starts from the clock, so it never repeats the
+    # generation of an entry stored before the key expired; an entry
+    # outliving its counter can't be checked and is ignored
+    shared.add(
+        _generation_key(key), time.time_ns(),
+        cache_settings()['SHARED_TTL'],
+    )
+
+
+def _forget_shared(keys):
+    """Make the shared cache entries of token keys stale."""
+    shared = _shared_cache()
+    if shared is None or not keys:
+        return
+    for key in keys:
+        try:
+            shared.incr(_generation_key(key))
+        except ValueError:
+            # expired or never set
+            _start_generation(shared, key)
+    shared.delete_many([_shared_key(key) for key in keys])
+
+
+def _now_and_on_commit(forget):
+    """Call forget, and again once the current transaction commits."""
+    forget()
+    # a lookup reading the rows before the commit may have cached them
+    # again since the first call
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(forget)
+
+
+def invalidate_token(key):
+    """Forget a cached token in this process and the shared cache."""
+    def forget():
+        local_cache.delete(key)
+        _forget_shared([key])
+    _now_and_on_commit(forget)
+
+
+def invalidate_user(user_id, keys=()):
+    """Forget every cached token of a user."""
+    keys = list(keys)
+
+    def forget():
+        local_cache.delete_owner(user_id)
+        _forget_shared(keys)
+    _now_and_on_commit(forget)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token and user lookup."""
+
+    def _cached_token(self, key):
+        """Return the cached token for key, or None."""
+        blob = local_cache.get(key)
+        if blob is None:
+            shared = _shared_cache()
+            if shared is None:
+                return None
+            found = shared.get_many([_shared_key(key), _generation_key(key)])
+            entry = found.get(_shared_key(key))
+            # an entry stored from rows read before an invalidation has
+            # the generation that invalidation moved past
+            if entry is None or entry[1] != found.get(_generation_key(key)):
+                return None
+            owner, _, blob = entry
+            self._store_local(key, owner, blob)
+        # every request gets its own copy of the token and user
+        return pickle.loads(blob)
+
+    def _store_local(self, key, owner, blob):
+        options = cache_settings()
+        local_cache.set(
+            key, blob, options['MAX_SIZE'], ttl=options['TTL'], owner=owner,
+        )
+
+    def authenticate_credentials(self, key):
+        """Return (user, token) from the cache or the database."""
+        token = self._cached_token(key)
+        if token is None:
+            shared = _shared_cache()
+            # taken before the rows are read, so an invalidation landing
+            # after the read leaves the entry stored below stale
+            generation = None
+            if shared is not None:
+                generation = _generation(shared, key)
+            # one Token + User join, then cached for the next requests
+            user, token = super().authenticate_credentials(key)
+            blob = pickle.dumps(token)
+            self._store_local(key, user.pk, blob)
+            if shared is not None:
+                shared.set(
+                    _shared_key(key), (user.pk, generation, blob),
+                    cache_settings()['SHARED_TTL'],
+                )
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return (token.user, token)
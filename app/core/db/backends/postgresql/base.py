@@ -0,0 +1,160 @@
+"""
+PostgreSQL backend with connection health checks and pooling
+
+Two keys of the DATABASES entry are read on top of Django's:
+
+- CONN_HEALTH_CHECKS: check a reused connection with `SELECT 1` before
+  its first use in each request, and reconnect if the server closed it,
+  as Django 4.1 does. Without it a persistent connection dropped by a
+  database restart fails the next request.
+- POOL: a dict with MAX_SIZE, TIMEOUT and MAX_IDLE, or None. Closing a
+  connection then returns it to an in-process pool shared by the
+  threads of the worker, see core.db.pool.
+"""
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+
+from core.db.pool import PoolTimeout, close_pools, get_pool
+
+Database = base.Database
+
+
+def reset_connection(connection):
+    """Make a connection ready for the next user, False if it is not."""
+    if connection.closed:
+        return False
+    try:
+        # ends the transaction of a connection closed in an atomic block
+        if (connection.get_transaction_status()
+                != Database.extensions.TRANSACTION_STATUS_IDLE):
+            connection.rollback()
+    except Database.Error:
+        return False
+    return (
+        connection.get_transaction_status()
+        == Database.extensions.TRANSACTION_STATUS_IDLE
+    )
+
+
+def ping(connection):
+    """Return True if the server answers on connection."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+def close_connection(connection):
+    """Close a connection, ignoring one that is already broken."""
+    try:
+        connection.close()
+    except Database.Error:
+        pass
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Test database handling that also closes pooled connections."""
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the database in use
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL connections with health checks and optional pooling."""
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        # pool the current connection came from
+        self.connection_pool = None
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def _pool(self, conn_params):
+        """Return the pool for conn_params, or None when not pooling."""
+        options = self.settings_dict.get('POOL')
+        # test database creation connects to the postgres database
+        if not options or self.alias == NO_DB_ALIAS:
+            return None
+        return get_pool(
+            self.alias, conn_params,
+            reset=reset_connection,
+            close=close_connection,
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 10),
+            max_idle=options.get('MAX_IDLE', 300),
+        )
+
+    def get_new_connection(self, conn_params):
+        self.connection_pool = self._pool(conn_params)
+        if self.connection_pool is None:
+            connection = super().get_new_connection(conn_params)
+        else:
+            connection = self._pooled_connection(conn_params)
+        # a connection just opened or checked out needs no check
+        self.health_check_done = True
+        return connection
+
+    def _pooled_connection(self, conn_params):
+        """Take a working connection from the pool, or open one."""
+        def connect():
+            return super(DatabaseWrapper, self).get_new_connection(
+                conn_params,
+            )
+        while True:
+            try:
+                connection, reused = self.connection_pool.get(connect)
+            except PoolTimeout as exc:
+                raise Database.OperationalError(str(exc)) from exc
+            if not reused:
+                return connection
+            if not self.health_check_enabled or ping(connection):
+                break
+            # closed by the server while idle, e.g. by a restart
+            self.connection_pool.put(connection, discard=True)
+        # set on the connection when the pool opened it
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level,
+        )
+        return connection
+
+    def _close(self):
+        if self.connection_pool is None:
+            return super()._close()
+        # closed in an atomic block, the wrapper keeps the connection
+        # until the block exits, so it can't be handed out again yet
+        self.connection_pool.put(
+            self.connection,
+            discard=self.in_atomic_block or self.connection.closed != 0,
+        )
+
+    def close_if_health_check_failed(self):
+        """Close the connection if it fails its health check."""
+        if (self.connection is None or not self.health_check_enabled
+                or self.health_check_done):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def set_autocommit(self, autocommit, *args, **kwargs):
+        # the outermost atomic block starts here, before any cursor
+        self.validate_no_atomic_block()
+        self.close_if_health_check_failed()
+        super().set_autocommit(autocommit, *args, **kwargs)
+
+    def close_if_unusable_or_obsolete(self):
+        # runs at the start and end of each request
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
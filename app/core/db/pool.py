@@ -0,0 +1,179 @@
+"""
+In-process pools of open database connections
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """No connection was returned to a full pool in time."""
+
+
+class ConnectionPool:
+    """Thread safe pool of open database connections.
+
+    Up to max_size connections are open at once; get() waits up to
+    timeout seconds for one to be returned when they are all in use.
+    Connections idle longer than max_idle seconds are closed.
+    """
+
+    def __init__(self, reset, close, max_size=10, timeout=10, max_idle=300):
+        # reset(connection) ends any open transaction and returns False
+        # for a connection that can't be reused
+        self._reset = reset
+        self._close = close
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._cond = threading.Condition()
+        # (connection, returned at) with the most recently used last, so
+        # the least used connections age out when load drops
+        self._idle = []
+        # open connections, idle or in use
+        self._size = 0
+        self._closed = False
+        self._counters = dict.fromkeys(
+            ('created', 'reused', 'discarded', 'waits', 'timeouts'), 0,
+        )
+        self._wait_seconds = 0.0
+
+    def get(self, connect):
+        """Return (connection, reused), opening one with connect() if no
+        idle connection is left and the pool is not full."""
+        waited = None
+        with self._cond:
+            self._trim()
+            while not self._idle and self._size >= self.max_size:
+                now = time.monotonic()
+                if waited is None:
+                    waited = now
+                    self._counters['waits'] += 1
+                remaining = self.timeout - (now - waited)
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    self._wait_seconds += now - waited
+                    raise PoolTimeout(
+                        f'No connection free after {self.timeout}s, all '
+                        f'{self.max_size} are in use.'
+                    )
+                self._cond.wait(remaining)
+            if waited is not None:
+                self._wait_seconds += time.monotonic() - waited
+            if self._idle:
+                self._counters['reused'] += 1
+                return self._idle.pop()[0], True
+            # the slot is taken before connecting, outside the lock
+            self._size += 1
+        try:
+            connection = connect()
+        except Exception:
+            self._release_slot()
+            raise
+        with self._cond:
+            self._counters['created'] += 1
+        return connection, False
+
+    def put(self, connection, discard=False):
+        """Take back a connection from get(), closing it if discard."""
+        if not discard and not self._closed:
+            discard = not self._reset(connection)
+        with self._cond:
+            discard = discard or self._closed
+            if discard:
+                self._size -= 1
+                self._counters['discarded'] += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close(connection)
+
+    def close(self):
+        """Close the idle connections and those returned from now on."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def stats(self):
+        """Return the pool's gauges and counters."""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                **self._counters,
+                'wait_seconds': round(self._wait_seconds, 6),
+            }
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _trim(self):
+        """Close connections idle for longer than max_idle."""
+        # called with the lock held; closing only sends a terminate
+        # message, so it does not wait on the server
+        expired = time.monotonic() - self.max_idle
+        while self._idle and self._idle[0][1] < expired:
+            connection, _ = self._idle.pop(0)
+            self._size -= 1
+            self._counters['discarded'] += 1
+            self._close(connection)
+
+
+# (alias, connection parameters) -> pool, for this process only
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, params, **options):
+    """Return this process's pool for alias and connection params."""
+    global _pools, _pools_pid
+    key = (alias, repr(sorted(params.items())))
+    with _pools_lock:
+        # a forked child shares its parent's sockets; it must neither use
+        # nor close them, so it starts with pools of its own
+        if _pools_pid != os.getpid():
+            _pools = {}
+            _pools_pid = os.getpid()
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+def close_pools(alias=None):
+    """Close and forget the pools of alias, or of every alias."""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return
+        keys = [key for key in _pools if alias in (None, key[0])]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    """Return {alias: stats} of the pools in this process."""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return {}
+        pools = list(_pools.items())
+    stats = {}
+    for (alias, _), pool in pools:
+        current = pool.stats()
+        if alias in stats:
+            # the same alias pooled under other settings, e.g. in tests
+            current = {
+                name: stats[alias][name] + value
+                for name, value in current.items()
+            }
+        stats[alias] = current
+    return stats
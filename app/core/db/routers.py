@@ -0,0 +1,147 @@
+"""
+Routing of reads to the read replicas
+
+Safe requests to views with read_from_replica set read from one of
+DATABASE_REPLICAS picked at random; everything else, including all
+writes, management commands and workers, uses the primary.
+
+A replica lags behind the primary, so once a user writes their reads
+stay on the primary for DATABASE_REPLICA_PIN_SECONDS and they see their
+own changes. The pins are kept in the default cache, which has to be
+shared between the web workers for them to hold across workers.
+
+Migrations only run on the database they are given; the replicas get
+the schema through replication.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import LazyObject
+
+from rest_framework.permissions import SAFE_METHODS
+
+
+# request whose reads may go to a replica, set by ReplicaMiddleware
+_replica_request = ContextVar('replica_request', default=None)
+
+
+def _pin_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def pin_primary(user_id):
+    """Keep a user's reads on the primary while the replicas catch up."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(
+            _pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS,
+        )
+
+
+def is_pinned(user_id):
+    """Return True if a user's reads have to use the primary."""
+    return bool(cache.get(_pin_key(user_id)))
+
+
+def _authenticated_user(request):
+    """Return the user the view authenticated, or None."""
+    user = getattr(request, 'user', None)
+    # the lazy user of AuthenticationMiddleware is replaced once the
+    # view authenticates; evaluating it would query the session
+    if user is None or isinstance(user, LazyObject):
+        return None
+    return user if user.is_authenticated else None
+
+
+def _read_alias(request):
+    """Return the database a request reads from, None until it's known."""
+    user = _authenticated_user(request)
+    if user is None:
+        # authentication reads from the primary, so a token created
+        # just before is found
+        return None
+    if is_pinned(user.pk):
+        return DEFAULT_DB_ALIAS
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    """Send reads of safe requests to a replica and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        request = _replica_request.get()
+        if request is None or not getattr(request, 'read_from_replica', False):
+            return None
+        if request.read_alias is None:
+            # one database for the whole request, so its reads agree
+            request.read_alias = _read_alias(request)
+        return request.read_alias
+
+    def db_for_write(self, model, **hints):
+        # instances read from a replica are saved to the primary
+        instance = hints.get('instance')
+        if (instance is not None
+                and instance._state.db in settings.DATABASE_REPLICAS):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def _in_request(request, chunks):
+    """Yield chunks, each produced with request's reads routed."""
+    chunks = iter(chunks)
+    while True:
+        # the server reads the body after the middleware returned, maybe
+        # in another context, so the request is set around every chunk
+        token = _replica_request.set(request)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _replica_request.reset(token)
+        yield chunk
+
+
+class ReplicaMiddleware:
+    """Let safe requests read from a replica and pin users who write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            user = _authenticated_user(request)
+            if user is not None:
+                pin_primary(user.pk)
+            return response
+        request.read_from_replica = False
+        request.read_alias = None
+        token = _replica_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_request.reset(token)
+        if response.streaming and request.read_from_replica:
+            # streamed bodies such as exports query while they are sent
+            response.streaming_content = _in_request(
+                request, response.streaming_content,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # viewsets opt in, views writing on GET keep to the primary
+        view_class = getattr(view_func, 'cls', None)
+        if (settings.DATABASE_REPLICAS
+                and request.method in SAFE_METHODS
+                and getattr(view_class, 'read_from_replica', False)):
+            request.read_from_replica = True
@@ -0,0 +1,144 @@
+"""
+Background job queue stored in the database
+
+Jobs are rows of core.models.Job. Workers claim due jobs with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so any number of them share the
+table without a broker and without blocking each other. A claimed job
+stays in the table while it runs and is deleted once it succeeds, so
+jobs run at least once: handlers must be safe to run again.
+"""
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# job name -> (handler, default options)
+_handlers = {}
+
+
+def register(name, priority=0, max_attempts=None):
+    """Register the decorated function as the handler of name jobs.
+
+    The job payload is passed to it as keyword arguments.
+    """
+    def decorator(func):
+        _handlers[name] = (func, {
+            'priority': priority, 'max_attempts': max_attempts,
+        })
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, priority=None, delay=0, max_attempts=None):
+    """Queue a job and return it.
+
+    Inside a transaction the job is only seen by workers once it commits,
+    and it is dropped with a rollback.
+    """
+    if name not in _handlers:
+        raise LookupError(f'No job handler registered as {name!r}.')
+    defaults = _handlers[name][1]
+    if priority is None:
+        priority = defaults['priority']
+    if max_attempts is None:
+        max_attempts = defaults['max_attempts'] or settings.JOB_MAX_ATTEMPTS
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+def claim(worker, timeout=None):
+    """Take the next due job for worker and return it, or None."""
+    if timeout is None:
+        timeout = settings.JOB_VISIBILITY_TIMEOUT
+    now = timezone.now()
+    with transaction.atomic():
+        # rows locked by other workers' claims are skipped, not waited on
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED, run_at__lte=now,
+        ).order_by('-priority', 'run_at', 'id').first()
+        if job is None:
+            return None
+        # the job is hidden until the timeout instead of locked while it
+        # runs, so a long job holds no transaction open
+        job.attempts += 1
+        job.run_at = now + timedelta(seconds=timeout)
+        job.locked_by = worker
+        job.save(update_fields=['attempts', 'run_at', 'locked_by'])
+    return job
+
+
+def backoff(attempts):
+    """Return the seconds to wait before retrying after attempts tries."""
+    delay = min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOB_RETRY_BACKOFF_MAX,
+    )
+    # jitter spreads out jobs that failed together, e.g. on an outage
+    return delay * random.uniform(0.5, 1)
+
+
+def run_job(job):
+    """Run a claimed job and return True if it succeeded.
+
+    A job that fails is retried with backoff until it has made
+    max_attempts attempts, and is then kept as failed.
+    """
+    handler, _ = _handlers.get(job.name, (None, None))
+    # matching attempts skips a job whose timeout ran out and that
+    # another worker has claimed again meanwhile
+    current = Job.objects.filter(pk=job.pk, attempts=job.attempts)
+    try:
+        if handler is None:
+            raise LookupError(f'No job handler registered as {job.name!r}.')
+        handler(**job.payload)
+    except Exception:
+        logger.exception('Job %s failed on attempt %s', job, job.attempts)
+        changes = {'last_error': traceback.format_exc(), 'locked_by': ''}
+        if handler is not None and job.attempts < job.max_attempts:
+            changes['run_at'] = timezone.now() + timedelta(
+                seconds=backoff(job.attempts),
+            )
+        else:
+            changes['status'] = Job.FAILED
+        current.update(**changes)
+        return False
+    current.delete()
+    return True
+
+
+def work(worker, stop=None, burst=False):
+    """Run jobs until stop is set and return how many ran.
+
+    With burst, return as soon as no job is due.
+    """
+    if stop is None:
+        stop = threading.Event()
+    done = 0
+    while not stop.is_set():
+        # like a request, each job starts with a usable connection
+        close_old_connections()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(settings.JOB_POLL_INTERVAL)
+            continue
+        run_job(job)
+        done += 1
+    close_old_connections()
+    return done
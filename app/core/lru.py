@@ -0,0 +1,56 @@
+"""
+Bounded in-process cache
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread safe least recently used cache with an optional time to live."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (expiry time or None, owner, value)
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, owner, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, max_size, ttl=None, owner=None):
+        """Store value for key, evicting the least recently used entry.
+
+        Entries without a ttl only leave by eviction or deletion.
+        """
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires, owner, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_owner(self, owner):
+        """Remove every entry stored for owner."""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e[1] == owner]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
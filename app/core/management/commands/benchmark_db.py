@@ -0,0 +1,158 @@
+"""
+Django command to measure the database connection cost of a request
+"""
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+from core.db.pool import close_pools, pool_stats
+
+
+def strategies(pool_size):
+    """Return {name: DATABASES entry changes} of each strategy."""
+    return {
+        # a connection opened and closed by every request
+        'new': {'CONN_MAX_AGE': 0, 'POOL': None},
+        # one connection per thread kept across requests
+        'persistent': {'CONN_MAX_AGE': 60, 'POOL': None},
+        # connections shared by the threads, returned after each request
+        'pool': {
+            'CONN_MAX_AGE': 0,
+            'POOL': {'MAX_SIZE': pool_size, 'TIMEOUT': 30, 'MAX_IDLE': 300},
+        },
+    }
+
+
+class Command(BaseCommand):
+    """Django command to compare connection strategies"""
+    help = (
+        'Run simulated requests of one query each with new, persistent '
+        'and pooled connections, and report the latency per request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests run by each thread per strategy.',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Threads sending requests at the same time.',
+        )
+        parser.add_argument(
+            '--pool-size', type=int, default=None,
+            help='Connections in the pool, the number of threads by '
+                 'default; fewer makes requests wait for one.',
+        )
+        parser.add_argument(
+            '--query', default='SELECT 1',
+            help='SQL run by each request.',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to measure.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        alias = options['database']
+        threads = max(options['threads'], 1)
+        pool_size = options['pool_size'] or threads
+        results = {}
+        self.stdout.write(
+            f"{'strategy':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'opened':>10}"
+        )
+        for name, changes in strategies(pool_size).items():
+            if changes['POOL'] and not self._can_pool(alias):
+                self.stdout.write(f'{name:<12}not supported by the backend')
+                continue
+            latencies, opened, stats = self._measure(
+                alias, changes, threads, options['requests'],
+                options['query'],
+            )
+            results[name] = statistics.mean(latencies)
+            self.stdout.write(
+                f'{name:<12}{results[name] * 1000:>10.3f}'
+                f'{statistics.median(latencies) * 1000:>10.3f}'
+                f'{self._p95(latencies) * 1000:>10.3f}{opened:>10}'
+            )
+            if stats:
+                self.stdout.write(
+                    f"{'':<12}{stats['reused']} reused, "
+                    f"{stats['waits']} waits "
+                    f"({stats['wait_seconds']:.3f}s), "
+                    f"{stats['timeouts']} timeouts, "
+                    f"{stats['idle']} of {stats['size']} idle"
+                )
+        for name in ('persistent', 'pool'):
+            if 'new' in results and name in results:
+                saved = (results['new'] - results[name]) * 1000
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name} saves {saved:.3f} ms per request over new'
+                ))
+
+    def _can_pool(self, alias):
+        # only the core.db backends read the POOL setting
+        return hasattr(connections[alias], 'connection_pool')
+
+    def _p95(self, latencies):
+        if len(latencies) < 2:
+            return latencies[0]
+        return statistics.quantiles(latencies, n=20)[-1]
+
+    def _measure(self, alias, changes, threads, requests, query):
+        """Return the latencies, connections opened and pool stats."""
+        # every thread's connection shares this settings dict
+        settings_dict = connections[alias].settings_dict
+        saved = {key: settings_dict.get(key) for key in changes}
+        latencies = []
+        connects = []
+        errors = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == alias:
+                connects.append(1)
+
+        def client():
+            connection = connections[alias]
+            try:
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    # the request signals close or return connections as
+                    # Django does around each request
+                    request_started.send(sender=self.__class__)
+                    with connection.cursor() as cursor:
+                        cursor.execute(query)
+                        cursor.fetchall()
+                    request_finished.send(sender=self.__class__)
+                    latencies.append(time.perf_counter() - started)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        connections[alias].close()
+        settings_dict.update(changes)
+        connection_created.connect(count)
+        try:
+            workers = [threading.Thread(target=client) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            stats = pool_stats().get(alias) if changes['POOL'] else None
+        finally:
+            connection_created.disconnect(count)
+            close_pools(alias)
+            settings_dict.update(saved)
+        if errors:
+            raise CommandError(f'Requests failed: {errors[0]}')
+        # a connect with pooling mostly checks out an open connection
+        opened = stats['created'] if stats else len(connects)
+        return latencies, opened, stats
@@ -0,0 +1,181 @@
+"""
+Django command to remove media files no recipe uses
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import MediaBlob
+from recipe.media import referenced_names
+
+
+QUARANTINE_DIR = '.quarantine'
+
+
+def walk(root, skip):
+    """Yield (name, size, mtime) of every file under root.
+
+    Directories are read one at a time with scandir, so memory grows
+    with the depth of the tree and not with the number of files.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path != skip:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    name = os.path.relpath(entry.path, root)
+                    yield (
+                        name.replace(os.sep, '/'), stat.st_size,
+                        stat.st_mtime,
+                    )
+
+
+def batches(items, size):
+    """Yield lists of up to size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect unreferenced media files"""
+    help = (
+        'Delete or quarantine files under MEDIA_ROOT that no recipe uses '
+        'as its image or image variant.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report orphans without removing anything.',
+        )
+        parser.add_argument(
+            '--quarantine', nargs='?', const=QUARANTINE_DIR,
+            help='Move orphans to this directory (relative to MEDIA_ROOT, '
+                 f'{QUARANTINE_DIR} by default) instead of deleting them.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=24 * 60 * 60,
+            help='Only remove files older than this many seconds.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Files checked against the database per query.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Threads deleting or moving files.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        root = os.path.abspath(settings.MEDIA_ROOT)
+        quarantine = None
+        if options['quarantine']:
+            quarantine = os.path.join(root, options['quarantine'])
+        self.dry_run = options['dry_run']
+        # files written recently may belong to an upload not committed yet
+        self.cutoff = time.time() - options['min_age']
+        self.blob_cutoff = timezone.now() - timedelta(
+            seconds=settings.MEDIA_BLOB_GRACE_SECONDS,
+        )
+        self.stats = dict.fromkeys(
+            ('scanned', 'orphans', 'bytes', 'removed', 'errors'), 0,
+        )
+        started = time.monotonic()
+        # read once up front, uploads made during the walk are caught by
+        # the blob rows checked for every batch
+        self.used = referenced_names()
+
+        skip = quarantine or os.path.join(root, QUARANTINE_DIR)
+        with ThreadPoolExecutor(options['workers']) as pool:
+            for batch in batches(walk(root, skip), options['batch_size']):
+                self.stats['scanned'] += len(batch)
+                orphans = self._orphans(batch)
+                self.stats['orphans'] += len(orphans)
+                self.stats['bytes'] += sum(orphans.values())
+                if orphans and not self.dry_run:
+                    self._remove(pool, orphans, root, quarantine)
+                self._report(started)
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        action = 'would remove' if self.dry_run else 'removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {self.stats['scanned']} files, {action} "
+            f"{self.stats['orphans']} orphans "
+            f"({self.stats['bytes'] / 2 ** 20:.1f} MiB) in {elapsed:.1f}s, "
+            f"{self.stats['scanned'] / elapsed:.0f} files/s, "
+            f"{self.stats['errors']} errors"
+        ))
+
+    def _report(self, started):
+        """Write the progress so far."""
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f"{self.stats['scanned']} files, {self.stats['orphans']} "
+            f"orphans, {self.stats['scanned'] / elapsed:.0f} files/s"
+        )
+
+    def _orphans(self, batch):
+        """Return {name: size} of the old files in batch nobody uses."""
+        old = {
+            name: size for name, size, mtime in batch
+            if mtime < self.cutoff and name not in self.used
+        }
+        if not old:
+            return {}
+        # blobs counted by other owners, or just resolved by an upload
+        used = set(MediaBlob.objects.filter(
+            Q(refcount__gt=0) | Q(touched_at__gte=self.blob_cutoff),
+            name__in=list(old),
+        ).values_list('name', flat=True))
+        return {name: size for name, size in old.items() if name not in used}
+
+    def _remove(self, pool, orphans, root, quarantine):
+        """Delete or move orphans, dropping their blob rows."""
+        def remove(name):
+            path = os.path.join(root, name)
+            try:
+                if quarantine:
+                    target = os.path.join(quarantine, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(path, target)
+                else:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                self.stderr.write(f'{name}: {exc}')
+                return False
+            return True
+
+        with transaction.atomic():
+            # an upload resolving to one of these blobs waits on the row
+            # lock until the file is gone, then writes it again
+            rows = MediaBlob.objects.select_for_update().filter(
+                name__in=list(orphans),
+            ).values_list('name', 'refcount', 'touched_at')
+            for name, refcount, touched_at in rows:
+                # referenced since the batch was checked
+                if refcount or touched_at >= self.blob_cutoff:
+                    del orphans[name]
+            MediaBlob.objects.filter(name__in=list(orphans)).delete()
+            for done in pool.map(remove, orphans):
+                self.stats['removed' if done else 'errors'] += 1
@@ -0,0 +1,37 @@
+"""
+Django command to remove soft deleted users and recipes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.purge import CHUNK_SIZE, purge_deleted
+
+
+class Command(BaseCommand):
+    """Django command to purge soft deleted rows in small chunks"""
+    help = (
+        'Delete users and recipes marked deleted, a primary key range '
+        'at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=0,
+            help='Only purge rows deleted more than this many seconds ago.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=CHUNK_SIZE,
+            help='Rows deleted per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        started = time.monotonic()
+        deleted = purge_deleted(options['min_age'], options['batch_size'])
+        for label, count in sorted(deleted.items()):
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {sum(deleted.values())} rows in '
+            f'{time.monotonic() - started:.1f}s'
+        ))
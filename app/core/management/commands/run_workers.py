@@ -0,0 +1,99 @@
+"""
+Django command to run background jobs
+"""
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import work
+
+
+def worker_name(index):
+    """Return the name a worker records on the jobs it claims."""
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def run_worker(index, stop, burst):
+    """Run one worker until stop is set."""
+    work(worker_name(index), stop, burst)
+
+
+class Command(BaseCommand):
+    """Django command to run job queue workers"""
+    help = (
+        'Run queued background jobs in worker processes until '
+        'interrupted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOB_WORKERS,
+            help='Worker processes; 1 runs the jobs in this process.',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is due instead of waiting for more.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        workers = max(options['workers'], 1)
+        burst = options['burst']
+        # fork, as the command runs no threads and the children need the
+        # configured Django; each opens its own database connection
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+
+        def shutdown(signum, frame):
+            # workers finish the job they are running, then exit
+            stop.set()
+        handlers = {
+            signum: signal.signal(signum, shutdown)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        self.stdout.write(f'Starting {workers} job workers')
+        try:
+            if workers == 1:
+                run_worker(0, stop, burst)
+            else:
+                self._supervise(context, workers, stop, burst)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
+
+    def _supervise(self, context, workers, stop, burst):
+        """Run workers in child processes until they all exit."""
+        connections.close_all()
+        processes = {}
+        for index in range(workers):
+            processes[index] = self._start(context, index, stop, burst)
+        while processes:
+            for index, process in list(processes.items()):
+                process.join(timeout=1)
+                if process.exitcode is None:
+                    continue
+                if process.exitcode == 0 or stop.is_set():
+                    del processes[index]
+                else:
+                    # a crashed worker's job is retried once its
+                    # visibility timeout runs out
+                    self.stderr.write(
+                        f'Worker {index} exited with {process.exitcode}, '
+                        'restarting'
+                    )
+                    processes[index] = self._start(
+                        context, index, stop, burst,
+                    )
+
+    def _start(self, context, index, stop, burst):
+        process = context.Process(
+            target=run_worker, args=(index, stop, burst), daemon=True,
+        )
+        process.start()
+        return process
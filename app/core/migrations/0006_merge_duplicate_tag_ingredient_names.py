@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:27
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Point recipes at one row per (user, name) and delete the rest."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, relation).through
+        column = f'{model_name.lower()}_id'
+        duplicates = model.objects.values('user', 'name').annotate(
+            keep=Min('id'), rows=Count('id'),
+        ).filter(rows__gt=1)
+        for dup in duplicates:
+            others = model.objects.filter(
+                user=dup['user'], name=dup['name'],
+            ).exclude(id=dup['keep'])
+            # recipes linked to both rows keep their existing link
+            linked = through.objects.filter(
+                **{column: dup['keep']}
+            ).values('recipe_id')
+            through.objects.filter(
+                **{f'{column}__in': others}, recipe_id__in=linked,
+            ).delete()
+            through.objects.filter(**{f'{column}__in': others}).update(
+                **{column: dup['keep']}
+            )
+            others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_names, migrations.RunPython.noop,
+        ),
+    ]
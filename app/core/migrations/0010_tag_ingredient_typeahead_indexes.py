@@ -0,0 +1,66 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:05
+
+from django.db import migrations
+
+
+TABLES = ('core_tag', 'core_ingredient')
+
+# matches the UPPER("name"::text) LIKE 'PREFIX%' that istartswith compiles
+# to; text_pattern_ops lets LIKE use the index under any collation
+PREFIX_INDEX_SQL = """
+CREATE INDEX {table}_user_name_prefix_idx
+    ON {table} (user_id, UPPER(name::text) text_pattern_ops);
+"""
+
+TRIGRAM_INDEX_SQL = """
+CREATE INDEX {table}_name_trgm_idx
+    ON {table} USING gin (name gin_trgm_ops);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS {table}_name_trgm_idx;
+DROP INDEX IF EXISTS {table}_user_name_prefix_idx;
+"""
+
+
+def _trigram_available(cursor):
+    cursor.execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )
+    return cursor.fetchone() is not None
+
+
+def create_typeahead_indexes(apps, schema_editor):
+    """Create the prefix and trigram name indexes on PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(PREFIX_INDEX_SQL.format(table=table))
+    # servers built without contrib keep prefix matching only
+    with schema_editor.connection.cursor() as cursor:
+        if not _trigram_available(cursor):
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    for table in TABLES:
+        schema_editor.execute(TRIGRAM_INDEX_SQL.format(table=table))
+
+
+def drop_typeahead_indexes(apps, schema_editor):
+    """Drop the prefix and trigram name indexes on PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(DROP_SQL.format(table=table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_typeahead_indexes, drop_typeahead_indexes,
+        ),
+    ]
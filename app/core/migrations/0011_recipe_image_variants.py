@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+def set_column_default(apps, schema_editor):
+    """Keep a database default for rows inserted with COPY on PostgreSQL."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "ALTER TABLE core_recipe "
+            "ALTER COLUMN image_variants SET DEFAULT '{}'::jsonb"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_tag_ingredient_typeahead_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        # Django drops the default after filling existing rows
+        migrations.RunPython(set_column_default, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,10 @@ Database Models
 import uuid
 import os
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,  # for authentication
     BaseUserManager,  # helps user creation
@@ -58,11 +61,49 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)  # default user is active
     # (from permissionmixin class) no regular user should login to admin
     is_staff = models.BooleanField(default=False)
+    # set when the account is closed; the user and their data are removed
+    # later in small chunks by the purge_deleted command
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     # for linkage to user model objects = UserManager()
+    # deleted users stay visible here, so their email stays taken and
+    # they fail authentication as inactive until purged
     objects = UserManager()
     USERNAME_FIELD = 'email'  # sets as unique
 
+    class Meta:
+        indexes = [
+            # only deleted rows are indexed, for the purge to find them
+            models.Index(
+                fields=['deleted_at'], name='user_deleted_at_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
+
+    def soft_delete(self):
+        """Close the account now and leave the data to the purge."""
+        self.deleted_at = timezone.now()
+        self.is_active = False
+        self.save(update_fields=['deleted_at', 'is_active'])
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queries with soft deletion."""
+
+    def soft_delete(self):
+        """Mark the recipes deleted without removing any rows.
+
+        Like update(), this sends no model signals.
+        """
+        return self.update(deleted_at=timezone.now())
+
+
+class LiveRecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    """Manager hiding recipes that were soft deleted."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 # Model is base class
 class Recipe(models.Model):
@@ -70,6 +111,8 @@ class Recipe(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,  # if user gets deleted also delete recipes
+        # the (user, -id) index below also serves lookups by user
+        db_index=False,
     )
     title = models.CharField(max_length=255)
     # TextField designed to hold more content but not that fast
@@ -82,11 +125,45 @@ class Recipe(models.Model):
     # passing the function reference to dynamically generate a new path
     # each time function is called
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # storage paths of the resized copies of image, filled in by a
+    # background job: {variant: {extension: path}}
+    image_variants = models.JSONField(default=dict, editable=False)
+    # weighted title/description lexemes for full text search; on
+    # PostgreSQL a trigger keeps it current on every insert and on updates
+    # of title or description, and a GIN index serves the search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # set by a delete through the API; the row, its links and its media
+    # are removed later in small chunks by the purge_deleted command
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # the default manager only returns recipes that are not deleted;
+    # cascades and related objects go through the base manager and
+    # still see every row
+    objects = LiveRecipeManager()
+    all_objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # serves `WHERE user_id = ? ORDER BY id DESC` without a sort
+            models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+            # only deleted rows are indexed, for the purge to find them
+            models.Index(
+                fields=['deleted_at'], name='recipe_deleted_at_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
 
 # string representation of object as titles
     def __str__(self):
         return self.title
 
+    def media_names(self):
+        """Return the storage names of the image and its variants."""
+        names = {self.image.name} if self.image else set()
+        for files in self.image_variants.values():
+            names.update(files.values())
+        return names
+
 
 class Tag(models.Model):
     """Tag for filtering recipes"""
@@ -94,8 +171,19 @@ class Tag(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,  # if user gets deleted also delete recipes
+        # the unique (user, name) index also serves lookups by user
+        db_index=False,
     )
 
+    class Meta:
+        constraints = [
+            # its (user, name) index also serves the per-user list
+            # ordered by name, and get-or-create can't race into duplicates
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='tag_unique_user_name',
+            ),
+        ]
+
     # string representation of object as names
     def __str__(self):
         return self.name
@@ -107,7 +195,71 @@ class Ingredient(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        # the unique (user, name) index also serves lookups by user
+        db_index=False,
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='ingredient_unique_user_name',
+            ),
+        ]
+
     def __str__(self):
         return self.name
+
+
+class MediaBlob(models.Model):
+    """Uploaded file stored once under its content hash."""
+    # storage name, derived from the SHA-256 of the content
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    # number of model fields pointing at the blob
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # last time an upload resolved to the blob; unreferenced blobs are
+    # only removed once this is older than MEDIA_BLOB_GRACE_SECONDS
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    """Background work run by the run_workers command, see core.jobs."""
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (FAILED, 'Failed')]
+
+    # name the handler was registered under
+    name = models.CharField(max_length=255)
+    # keyword arguments of the handler
+    payload = models.JSONField(default=dict)
+    # higher priorities are claimed first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED,
+    )
+    # a queued job is due from run_at; claiming it moves run_at past the
+    # visibility timeout, so the job of a worker that died runs again
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # worker holding the job, for inspecting a running queue
+    locked_by = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # serves the claim query; finished jobs are deleted and
+            # failed ones are left out, so it only holds pending work
+            models.Index(
+                fields=['-priority', 'run_at'], name='job_due_idx',
+                condition=Q(status='queued'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
@@ -0,0 +1,77 @@
+"""
+Chunked removal of soft deleted users and recipes
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from core.jobs import register
+from core.models import Ingredient, Recipe, Tag
+
+
+# rows deleted per transaction
+CHUNK_SIZE = 500
+
+
+def delete_in_chunks(queryset, chunk_size):
+    """Delete the rows of queryset a primary key range at a time.
+
+    Each range covers at most chunk_size rows and is deleted in its own
+    transaction, so locks are held for one chunk and the collector never
+    loads more than one chunk with its related rows. Return a Counter of
+    the rows deleted per model.
+    """
+    deleted = Counter()
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        last = pks[-1]
+        with transaction.atomic():
+            _, counts = queryset.filter(pk__range=(pks[0], last)).delete()
+        deleted.update(counts)
+
+
+@register('core.purge_recipes', priority=-10)
+def purge_recipes(ids, chunk_size=CHUNK_SIZE):
+    """Delete the recipes of ids that are still marked deleted."""
+    return delete_in_chunks(
+        Recipe.all_objects.filter(pk__in=ids, deleted_at__isnull=False),
+        chunk_size,
+    )
+
+
+@register('core.purge_user', priority=-10)
+def purge_user(user_id, chunk_size=CHUNK_SIZE):
+    """Delete a user's recipes, tags and ingredients, then the user."""
+    deleted = Counter()
+    user = get_user_model().objects.filter(pk=user_id)
+    if not user.filter(deleted_at__isnull=False).exists():
+        return deleted
+    for manager in (Recipe.all_objects, Tag.objects, Ingredient.objects):
+        deleted.update(
+            delete_in_chunks(manager.filter(user_id=user_id), chunk_size)
+        )
+    # nothing big is left for the cascade of the user row itself
+    with transaction.atomic():
+        _, counts = user.delete()
+    deleted.update(counts)
+    return deleted
+
+
+def purge_deleted(min_age=0, chunk_size=CHUNK_SIZE):
+    """Remove users and recipes soft deleted over min_age seconds ago."""
+    cutoff = timezone.now() - timedelta(seconds=min_age)
+    deleted = delete_in_chunks(
+        Recipe.all_objects.filter(deleted_at__lte=cutoff), chunk_size,
+    )
+    users = get_user_model().objects.filter(deleted_at__lte=cutoff)
+    for user_id in list(users.values_list('pk', flat=True)):
+        deleted.update(purge_user(user_id, chunk_size))
+    return deleted
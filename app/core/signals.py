@@ -0,0 +1,63 @@
+"""
+Signal handlers for core models
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_token, invalidate_user
+from core.models import Recipe
+from core.storage import acquire, release
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """Stop accepting a deleted token from the auth cache."""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_changed_user(sender, instance, **kwargs):
+    """Drop cached tokens when a user changes, e.g. deactivated."""
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    invalidate_user(instance.pk, list(keys))
+
+
+MEDIA_FIELDS = {'image', 'image_variants'}
+
+
+@receiver(post_init, sender=Recipe)
+def remember_media(sender, instance, **kwargs):
+    """Keep the stored files a recipe pointed at when loaded."""
+    if MEDIA_FIELDS & instance.get_deferred_fields():
+        # saving it cannot change the files; a delete looks them up
+        instance._saved_media = None
+    else:
+        instance._saved_media = instance.media_names()
+
+
+@receiver(post_save, sender=Recipe)
+def count_media_references(sender, instance, **kwargs):
+    """Move blob references from replaced files to new ones."""
+    if instance._saved_media is None:
+        return
+    current = instance.media_names()
+    acquire(current - instance._saved_media)
+    release(instance._saved_media - current)
+    instance._saved_media = current
+
+
+@receiver(pre_delete, sender=Recipe)
+def release_media(sender, instance, **kwargs):
+    """Drop the blob references of a recipe being deleted."""
+    if instance._saved_media is None:
+        instance.refresh_from_db(fields=MEDIA_FIELDS)
+        instance._saved_media = instance.media_names()
+    release(instance._saved_media)
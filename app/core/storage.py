@@ -0,0 +1,130 @@
+"""
+Content addressed file storage
+"""
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import MediaBlob
+
+
+# blobs live under blobs/ab/cd/abcd...<ext>
+BLOB_DIR = 'blobs'
+
+
+def blob_name(digest, ext):
+    """Return the storage name of content with the given SHA-256."""
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], f'{digest}{ext}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage keeping one copy of each distinct file.
+
+    Saved files are named after the hash of their content, so the name
+    passed in only contributes its extension. References are counted on
+    MediaBlob by acquire() and release(); delete() leaves blobs to them.
+    """
+
+    def _save(self, name, content):
+        # uploads are in memory or already in a temporary file, so they
+        # are hashed before anything is written to the media volume
+        digest = hashlib.sha256()
+        size = 0
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        name = blob_name(
+            digest.hexdigest(), os.path.splitext(name)[1].lower(),
+        )
+        known = MediaBlob.objects.filter(name=name).update(
+            touched_at=timezone.now(),
+        )
+        # a known image skips the write entirely
+        if not self.exists(name):
+            self._write(name, content)
+        if not known:
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(name=name, size=size)
+            except IntegrityError:
+                # saved concurrently by another upload
+                pass
+        return name
+
+    def _write(self, name, content):
+        """Write content to name through a temporary file."""
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                content.seek(0)
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # the same name always holds the same bytes, so a concurrent
+            # writer of the same blob can safely be replaced
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def get_available_name(self, name, max_length=None):
+        # names come from the content, so an existing name is a duplicate
+        # to reuse rather than a clash to avoid
+        return name
+
+    def delete(self, name):
+        """Delete untracked files; blobs are freed by release()."""
+        if not MediaBlob.objects.filter(name=name).exists():
+            super().delete(name)
+
+    def remove(self, name):
+        """Delete the file of a blob."""
+        super().delete(name)
+
+
+def acquire(names):
+    """Count a new reference to each blob name."""
+    if names:
+        MediaBlob.objects.filter(name__in=names).update(
+            refcount=F('refcount') + 1,
+        )
+
+
+def release(names):
+    """Drop a reference to each blob name, freeing unused blobs."""
+    if not names:
+        return
+    MediaBlob.objects.filter(name__in=names, refcount__gt=0).update(
+        refcount=F('refcount') - 1,
+    )
+    names = list(names)
+    transaction.on_commit(lambda: purge(names))
+
+
+def purge(names):
+    """Remove blobs among names that are unreferenced and past grace."""
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.MEDIA_BLOB_GRACE_SECONDS,
+    )
+    with transaction.atomic():
+        # locks the rows, so a concurrent upload waits for the file removal
+        # and then writes the blob again
+        unused = list(MediaBlob.objects.select_for_update().filter(
+            name__in=names, refcount=0, touched_at__lt=cutoff,
+        ).values_list('name', flat=True))
+        MediaBlob.objects.filter(name__in=unused).delete()
+        for name in unused:
+            default_storage.remove(name)
+    return unused
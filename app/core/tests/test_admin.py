@@ -3,11 +3,15 @@ Tests for Django admin modifications
 """
 
 
+from decimal import Decimal
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
 
+from core.models import Job, Recipe
+
 
 # test case for testing modifications in the Django admin interface.
 class AdminSiteTests(TestCase):
@@ -68,3 +72,43 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_delete_user_closes_account(self):
+        """Test deleting a user marks it deleted and queues the purge."""
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'core.purge_user')
+        self.assertEqual(job.payload, {'user_id': self.user.id})
+
+    def test_delete_selected_recipes_soft_deletes(self):
+        """Test deleting recipes keeps the rows until the purge job."""
+        recipes = [
+            Recipe.objects.create(
+                user=self.user, title='Soup', time_minutes=5,
+                price=Decimal('1.00'),
+            )
+            for _ in range(2)
+        ]
+        ids = [recipe.id for recipe in recipes]
+
+        res = self.client.post(reverse('admin:core_recipe_changelist'), {
+            'action': 'delete_selected', '_selected_action': ids,
+            'post': 'yes',
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(
+            Recipe.all_objects.filter(deleted_at__isnull=False).count(), 2,
+        )
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'core.purge_recipes')
+        self.assertCountEqual(job.payload['ids'], ids)
@@ -0,0 +1,125 @@
+"""
+Tests for the cached token authentication.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import local_cache
+
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test token lookups are cached and invalidated."""
+
+    def setUp(self):
+        local_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def _get_me(self):
+        """GET the profile and return the response and its queries."""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(ME_URL)
+        return res, ctx.captured_queries
+
+    def test_second_request_skips_token_query(self):
+        """Test a cached token authenticates without a query."""
+        res, first = self._get_me()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res, second = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+
+    def test_deleted_token_rejected(self):
+        """Test deleting a token invalidates the cache."""
+        self._get_me()
+
+        self.token.delete()
+        res, _ = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test deactivating a user invalidates the cache."""
+        self._get_me()
+
+        self.user.is_active = False
+        self.user.save()
+        res, _ = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_refreshes_user(self):
+        """Test a password change drops the cached user."""
+        self._get_me()
+
+        self.user.set_password('newpass123')
+        self.user.save()
+        res, queries = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+
+    def test_invalid_token_rejected(self):
+        """Test unknown tokens are not authenticated."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res, _ = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        TOKEN_AUTH_CACHE={'SHARED_CACHE': 'default', 'TTL': 0},
+    )
+    def test_shared_cache_tier(self):
+        """Test a token expired locally is served from the shared cache."""
+        self._get_me()
+
+        res, queries = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, [])
+
+    @override_settings(
+        TOKEN_AUTH_CACHE={'SHARED_CACHE': 'default', 'TTL': 0},
+    )
+    def test_lookup_racing_deactivation_not_cached(self):
+        """Test a user read just before deactivation isn't kept shared."""
+        lookup = TokenAuthentication.authenticate_credentials
+
+        def deactivated_meanwhile(auth, key):
+            result = lookup(auth, key)
+            # the signal clears the cache before the lookup stores it
+            user = get_user_model().objects.get(pk=self.user.pk)
+            user.is_active = False
+            user.save()
+            return result
+
+        with patch.object(
+            TokenAuthentication, 'authenticate_credentials',
+            deactivated_meanwhile,
+        ):
+            self._get_me()
+        res, _ = self._get_me()
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -3,6 +3,12 @@ Test custom Django management commands
 """
 # mocks behaviour
 from unittest.mock import patch
+from io import StringIO
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
 
 
 from psycopg2 import OperationalError as Psycopg2Error
@@ -10,7 +16,17 @@ from psycopg2 import OperationalError as Psycopg2Error
 # stimulates the command by name same as command line
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from core.models import MediaBlob, Recipe, Tag, Ingredient
+from recipe.media import referenced_names
 
 # patch decorator replaces the real database check with a fake one.
 
@@ -44,3 +60,327 @@ class CommandsTests(SimpleTestCase):
         call_command('wait_for_db')
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ImportRecipesTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _write(self, filename, content):
+        """Write content to a temporary file and return its path."""
+        path = os.path.join(self.tmp.name, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_import_jsonl(self):
+        """Test importing recipes and deduplicated relations from JSONL."""
+        Tag.objects.create(user=self.user, name='Dinner')
+        rows = [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10 + i,
+                'price': '2.50',
+                'tags': ['Dinner', 'Quick'],
+                'ingredients': ['Salt', f'Ingredient {i}'],
+            }
+            for i in range(5)
+        ]
+        path = self._write(
+            'recipes.jsonl', '\n'.join(json.dumps(row) for row in rows),
+        )
+        out = StringIO()
+
+        call_command(
+            'import_recipes', path, user='user@example.com', batch_size=2,
+            stdout=out,
+        )
+
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 6)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 2)
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_import_csv_with_user_column(self):
+        """Test importing CSV rows owned by the user column."""
+        path = self._write(
+            'recipes.csv',
+            'user,title,time_minutes,price,tags\n'
+            'user@example.com,Soup,30,4.00,Warm;Starter\n'
+            'user@example.com,Salad,5,3.00,Starter\n',
+        )
+
+        call_command('import_recipes', path, stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        salad = Recipe.objects.get(title='Salad')
+        self.assertEqual(
+            list(salad.tags.values_list('name', flat=True)), ['Starter'],
+        )
+
+    def test_import_skips_invalid_rows(self):
+        """Test invalid rows are reported and skipped."""
+        path = self._write(
+            'recipes.jsonl',
+            json.dumps({'title': 'Ok', 'time_minutes': 1, 'price': '1'})
+            + '\n' + json.dumps({'title': 'No price', 'time_minutes': 1}),
+        )
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user='user@example.com',
+            stdout=StringIO(), stderr=err,
+        )
+
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertIn('Line 2 skipped', err.getvalue())
+
+    def test_import_after_deleted_recipe(self):
+        """Test ids of deleted recipes waiting for the purge aren't reused."""
+        deleted = Recipe.objects.create(
+            user=self.user, title='Gone', time_minutes=1, price=Decimal('1'),
+        )
+        Recipe.objects.filter(pk=deleted.pk).soft_delete()
+        path = self._write('recipes.jsonl', json.dumps(
+            {'title': 'New', 'time_minutes': 1, 'price': '1'},
+        ))
+
+        call_command(
+            'import_recipes', path, user='user@example.com', stdout=StringIO(),
+        )
+
+        self.assertEqual(Recipe.all_objects.count(), 2)
+        self.assertEqual(Recipe.objects.get().title, 'New')
+
+    def test_import_skips_malformed_json(self):
+        """Test a line that is not JSON skips only that row."""
+        path = self._write(
+            'recipes.jsonl',
+            '{"title": "Broken",\n'
+            + json.dumps({'title': 'Ok', 'time_minutes': 1, 'price': '1'})
+            + '\n[1, 2]\n',
+        )
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user='user@example.com',
+            stdout=StringIO(), stderr=err,
+        )
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), ['Ok'],
+        )
+        self.assertIn('Line 1 skipped', err.getvalue())
+        self.assertIn('Line 3 skipped', err.getvalue())
+
+    def test_import_skips_rows_beyond_field_limits(self):
+        """Test rows the columns can't hold are skipped, not the batch."""
+        valid = {'title': 'Ok', 'time_minutes': 1, 'price': '1.50'}
+        rows = [
+            valid,
+            {**valid, 'price': '1000.00'},
+            {**valid, 'price': '1.505'},
+            {**valid, 'title': 'x' * 256},
+            {**valid, 'tags': ['y' * 256]},
+            {**valid, 'time_minutes': None},
+            {**valid, 'tags': 5},
+        ]
+        path = self._write(
+            'recipes.jsonl', '\n'.join(json.dumps(row) for row in rows),
+        )
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user='user@example.com',
+            stdout=StringIO(), stderr=err,
+        )
+
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertFalse(Tag.objects.exists())
+        for line in range(2, 8):
+            self.assertIn(f'Line {line} skipped', err.getvalue())
+
+
+class GcMediaTests(TestCase):
+    """Test the gc_media command."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(
+            MEDIA_ROOT=self.tmp.name, MEDIA_BLOB_GRACE_SECONDS=0,
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1.00'),
+        )
+        self.recipe.image.save('soup.jpg', ContentFile(b'soup'))
+        self.legacy = self._file('uploads/recipe/old.jpg')
+        self.recent = self._file('uploads/recipe/new.jpg', age=0)
+        self.unused_blob = self._file('blobs/ab/cd/abcd.jpg')
+        MediaBlob.objects.create(
+            name='blobs/ab/cd/abcd.jpg', size=4, refcount=0,
+        )
+        os.utime(self.recipe.image.path, (0, 0))
+
+    def _file(self, name, age=10 ** 6):
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'data')
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command(
+            'gc_media', *args, '--batch-size=2', stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_removes_old_orphans(self):
+        """Test unreferenced old files and their blob rows are removed."""
+        out = self._run()
+
+        self.assertFalse(os.path.exists(self.legacy))
+        self.assertFalse(os.path.exists(self.unused_blob))
+        self.assertFalse(MediaBlob.objects.filter(refcount=0).exists())
+        self.assertTrue(os.path.exists(self.recent))
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertIn('Scanned 4 files, removed 2 orphans', out)
+
+    def test_dry_run(self):
+        """Test a dry run only reports orphans."""
+        out = self._run('--dry-run')
+
+        self.assertTrue(os.path.exists(self.legacy))
+        self.assertTrue(os.path.exists(self.unused_blob))
+        self.assertIn('would remove 2 orphans', out)
+
+    def test_quarantine(self):
+        """Test orphans can be moved aside instead of deleted."""
+        self._run('--quarantine')
+
+        self.assertFalse(os.path.exists(self.legacy))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.tmp.name, '.quarantine', 'uploads', 'recipe', 'old.jpg',
+        )))
+        # a second run does not scan the quarantine
+        self.assertIn('Scanned 2 files', self._run('--quarantine'))
+
+    def test_reads_references_in_chunks(self):
+        """Test one walk over the recipes finds images and variants."""
+        for i in range(3):
+            Recipe.objects.create(
+                user=self.recipe.user, title='Stew', time_minutes=5,
+                price=Decimal('1.00'), image=f'blobs/{i}.jpg',
+                image_variants={'thumb': {'webp': f'blobs/{i}.webp'}},
+            )
+        Recipe.objects.filter(image='blobs/2.jpg').soft_delete()
+
+        with self.assertNumQueries(2):
+            used = referenced_names(chunk_size=3)
+
+        self.assertEqual(used, {
+            self.recipe.image.name,
+            *(f'blobs/{i}.{ext}' for i in range(3) for ext in ('jpg', 'webp')),
+        })
+
+
+class PurgeDeletedTests(TestCase):
+    """Test the purge_deleted command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+
+    def _recipe(self, user, **params):
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1.00'),
+            **params,
+        )
+        recipe.tags.add(self.tag)
+        return recipe
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command('purge_deleted', '--batch-size=2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_purges_deleted_recipes_in_chunks(self):
+        """Test every deleted recipe and its links go, live ones stay."""
+        live = self._recipe(self.user)
+        for _ in range(5):
+            self._recipe(self.user)
+        Recipe.objects.exclude(pk=live.pk).soft_delete()
+
+        out = self._run()
+
+        self.assertEqual(list(Recipe.all_objects.all()), [live])
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+        self.assertIn('core.Recipe: 5', out)
+
+    def test_min_age_keeps_recent_deletes(self):
+        """Test rows deleted recently are kept with --min-age."""
+        Recipe.objects.filter(pk=self._recipe(self.user).pk).soft_delete()
+
+        self._run('--min-age=3600')
+
+        self.assertEqual(Recipe.all_objects.count(), 1)
+
+    def test_purges_deleted_user(self):
+        """Test a deleted user is removed with all their data."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        Ingredient.objects.create(user=other, name='Salt')
+        for _ in range(3):
+            self._recipe(other)
+        other.soft_delete()
+
+        self._run()
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=other.pk).exists()
+        )
+        self.assertFalse(Recipe.all_objects.filter(user=other).exists())
+        self.assertFalse(Ingredient.objects.filter(user=other).exists())
+        self.assertTrue(Tag.objects.filter(user=self.user).exists())
+
+
+class BenchmarkDbTests(TransactionTestCase):
+    """Test the benchmark_db command."""
+
+    def test_reports_each_strategy(self):
+        """Test latencies are reported per connection strategy."""
+        out = StringIO()
+
+        call_command(
+            'benchmark_db', '--requests=3', '--threads=2', stdout=out,
+        )
+
+        output = out.getvalue()
+        for name in ('new', 'persistent', 'pool'):
+            self.assertIn(f'\n{name} ', output)
+        self.assertIn('persistent saves', output)
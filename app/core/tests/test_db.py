@@ -0,0 +1,313 @@
+"""
+Tests for connection pooling, health checks and replica routing.
+"""
+import threading
+import time
+from unittest import skipUnless
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import DatabaseError, InterfaceError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db.pool import ConnectionPool, PoolTimeout, close_pools
+from core.db.routers import (
+    ReplicaMiddleware,
+    ReplicaRouter,
+    is_pinned,
+    pin_primary,
+)
+from core.models import Recipe
+
+
+HEALTH_URL = reverse('health')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.usable = True
+        self.closed = False
+
+
+def make_pool(**options):
+    return ConnectionPool(
+        reset=lambda conn: conn.usable,
+        close=lambda conn: setattr(conn, 'closed', True),
+        **options,
+    )
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the in-process connection pool."""
+
+    def test_returned_connection_reused(self):
+        """Test a connection put back is handed out again."""
+        pool = make_pool()
+        first, reused = pool.get(FakeConnection)
+        pool.put(first)
+
+        second, reused = pool.get(FakeConnection)
+
+        self.assertIs(second, first)
+        self.assertTrue(reused)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_full_pool_waits_for_a_connection(self):
+        """Test get() waits for a connection when all are in use."""
+        pool = make_pool(max_size=1)
+        held, _ = pool.get(FakeConnection)
+        timer = threading.Timer(0.05, pool.put, [held])
+        timer.start()
+
+        conn, reused = pool.get(FakeConnection)
+        timer.join()
+
+        self.assertIs(conn, held)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_seconds'], 0)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_full_pool_times_out(self):
+        """Test get() gives up once the timeout passes."""
+        pool = make_pool(max_size=1, timeout=0.01)
+        pool.get(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.get(FakeConnection)
+
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_unusable_connection_discarded(self):
+        """Test a connection that can't be reset is closed."""
+        pool = make_pool()
+        conn, _ = pool.get(FakeConnection)
+        conn.usable = False
+
+        pool.put(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_idle_connection_expires(self):
+        """Test connections idle longer than max_idle are closed."""
+        pool = make_pool(max_idle=0.01)
+        old, _ = pool.get(FakeConnection)
+        pool.put(old)
+        time.sleep(0.02)
+
+        conn, reused = pool.get(FakeConnection)
+
+        self.assertIsNot(conn, old)
+        self.assertFalse(reused)
+        self.assertTrue(old.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_failed_connect_frees_slot(self):
+        """Test a failed connect does not use up the pool."""
+        pool = make_pool(max_size=1)
+
+        def fail():
+            raise OSError
+
+        with self.assertRaises(OSError):
+            pool.get(fail)
+        conn, _ = pool.get(FakeConnection)
+
+        self.assertIsInstance(conn, FakeConnection)
+
+    def test_close(self):
+        """Test closing the pool closes idle and returned connections."""
+        pool = make_pool()
+        idle, _ = pool.get(FakeConnection)
+        busy, _ = pool.get(FakeConnection)
+        pool.put(idle)
+
+        pool.close()
+        pool.put(busy)
+
+        self.assertTrue(idle.closed)
+        self.assertTrue(busy.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+
+@skipUnless(
+    hasattr(connection, 'connection_pool'), 'needs the core.db backend',
+)
+class PostgresBackendTests(TransactionTestCase):
+    """Test health checks and pooling in the PostgreSQL backend."""
+
+    def _run_query(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()
+
+    def test_health_check_replaces_closed_connection(self):
+        """Test a persistent connection closed meanwhile is replaced."""
+        connection.ensure_connection()
+        broken = connection.connection
+        broken.close()
+
+        # the start of the next request
+        connection.close_if_unusable_or_obsolete()
+
+        self.assertEqual(self._run_query(connection), (1,))
+        self.assertIsNot(connection.connection, broken)
+
+    def test_without_health_check_closed_connection_fails(self):
+        """Test the check is what saves the request."""
+        if connection.settings_dict['CONN_MAX_AGE'] == 0:
+            self.skipTest('the connection is not kept between requests')
+        connection.ensure_connection()
+        connection.connection.close()
+        connection.close_if_unusable_or_obsolete()
+
+        with patch.dict(connection.settings_dict, CONN_HEALTH_CHECKS=False):
+            with self.assertRaises(InterfaceError):
+                self._run_query(connection)
+        connection.close()
+
+    def test_pooled_connection_reused(self):
+        """Test closing a pooled connection keeps it for the next use."""
+        connection.close()
+        self.addCleanup(close_pools, connection.alias)
+        with patch.dict(
+            connection.settings_dict, CONN_MAX_AGE=0, POOL={'MAX_SIZE': 2},
+        ):
+            self._run_query(connection)
+            raw = connection.connection
+            connection.close()
+
+            self.assertEqual(self._run_query(connection), (1,))
+
+            self.assertIs(connection.connection, raw)
+            pool = connection.connection_pool
+            connection.close()
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertGreaterEqual(pool.stats()['reused'], 1)
+
+
+class HealthViewTests(TestCase):
+    """Test the health endpoint."""
+
+    def test_health_ok(self):
+        """Test the endpoint reports the database without credentials."""
+        res = APIClient().get(HEALTH_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['database'], 'ok')
+        self.assertIn('pools', res.data)
+
+    def test_database_unavailable(self):
+        """Test a failing database is reported with 503."""
+        with patch('core.views.connection') as conn:
+            conn.cursor.side_effect = DatabaseError
+            res = APIClient().get(HEALTH_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def replica_view():
+    pass
+
+
+replica_view.cls = SimpleNamespace(read_from_replica=True)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Test which database the router picks for a request."""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.user = SimpleNamespace(pk=1, is_authenticated=True)
+
+    def _read_alias(self, request, view=replica_view, user=None):
+        """Return the alias a read in the view of request goes to."""
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            # set by the view's authentication
+            request.user = user or self.user
+            return HttpResponse(self.router.db_for_read(Recipe) or '')
+
+        middleware = ReplicaMiddleware(get_response)
+        return middleware(request).content.decode() or None
+
+    def test_safe_request_reads_replica(self):
+        """Test a GET to a replica view reads from the replica."""
+        request = RequestFactory().get('/')
+
+        self.assertEqual(self._read_alias(request), 'replica1')
+
+    def test_streamed_body_reads_replica(self):
+        """Test a body streamed after the middleware returns is routed."""
+        def get_response(request):
+            middleware.process_view(request, replica_view, (), {})
+            request.user = self.user
+            return StreamingHttpResponse(
+                self.router.db_for_read(Recipe) or '' for _ in range(2)
+            )
+
+        middleware = ReplicaMiddleware(get_response)
+        response = middleware(RequestFactory().get('/'))
+
+        self.assertIsNone(self.router.db_for_read(Recipe))
+        self.assertEqual(b''.join(response), b'replica1replica1')
+
+    def test_replica_instance_saved_to_primary(self):
+        """Test an instance read from a replica is written to the primary."""
+        recipe = Recipe()
+        recipe._state.db = 'replica1'
+
+        alias = self.router.db_for_write(Recipe, instance=recipe)
+
+        self.assertEqual(alias, 'default')
+
+    def test_pinned_user_reads_primary(self):
+        """Test a user who just wrote reads from the primary."""
+        pin_primary(self.user.pk)
+
+        alias = self._read_alias(RequestFactory().get('/'))
+
+        self.assertEqual(alias, 'default')
+
+    def test_write_pins_user(self):
+        """Test an unsafe request reads from and pins to the primary."""
+        self.assertIsNone(self._read_alias(RequestFactory().post('/')))
+
+        self.assertTrue(is_pinned(self.user.pk))
+
+    def test_view_without_replica_reads_primary(self):
+        """Test only views that opt in read from the replica."""
+        def view():
+            pass
+
+        self.assertIsNone(self._read_alias(RequestFactory().get('/'), view))
+
+    def test_unauthenticated_reads_primary(self):
+        """Test reads before the view authenticates use the primary."""
+        user = SimpleLazyObject(lambda: self.user)
+
+        self.assertIsNone(
+            self._read_alias(RequestFactory().get('/'), user=user),
+        )
+
+    def test_outside_request_reads_primary(self):
+        """Test commands and workers read from the primary."""
+        self.assertIsNone(self.router.db_for_read(Recipe))
@@ -0,0 +1,94 @@
+"""
+Tests for the query plans of the main view querysets.
+"""
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import views
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Index plans need PostgreSQL')
+class QueryPlanTests(TestCase):
+    """Test list querysets are answered from the composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        # a heavy user on a server with more data from other users
+        for owner, count in ((cls.user, 1000), (other, 5000)):
+            Recipe.objects.bulk_create([
+                Recipe(
+                    user=owner, title=f'Recipe {i}', time_minutes=5,
+                    price=Decimal('1.00'),
+                )
+                for i in range(count)
+            ])
+            for model in (Tag, Ingredient):
+                model.objects.bulk_create([
+                    model(user=owner, name=f'Name {i}') for i in range(count)
+                ])
+        with connection.cursor() as cursor:
+            for model in (Recipe, Tag, Ingredient):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def _view_queryset(self, viewset, url_name):
+        """Return the list queryset built by a viewset for self.user."""
+        request = APIRequestFactory().get(reverse(url_name))
+        force_authenticate(request, user=self.user)
+        view = viewset(request=Request(request), action='list')
+        view.format_kwarg = None
+        return view.get_queryset()
+
+    def _plan(self, queryset):
+        """Return the EXPLAIN output of the first page of queryset."""
+        with connection.cursor() as cursor:
+            # small test tables would otherwise always be scanned
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset[:100].explain()
+
+    def test_recipe_list_uses_user_id_index(self):
+        """Test recipes are read in order from the (user, -id) index."""
+        queryset = self._view_queryset(
+            views.RecipeViewSet, 'recipe:recipe-list',
+        )
+
+        plan = self._plan(queryset)
+
+        self.assertIn('recipe_user_id_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_tag_list_uses_user_name_index(self):
+        """Test tags are read in order from the (user, name) index."""
+        queryset = self._view_queryset(views.TagViewSet, 'recipe:tag-list')
+
+        plan = self._plan(queryset)
+
+        self.assertIn('tag_unique_user_name', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_ingredient_list_uses_user_name_index(self):
+        """Test ingredients are read in order from the (user, name) index."""
+        queryset = self._view_queryset(
+            views.IngredientViewSet, 'recipe:ingredient-list',
+        )
+
+        plan = self._plan(queryset)
+
+        self.assertIn('ingredient_unique_user_name', plan)
+        self.assertNotIn('Sort', plan)
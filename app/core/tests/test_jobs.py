@@ -0,0 +1,199 @@
+"""
+Tests for the database backed job queue.
+"""
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job, Tag
+
+
+calls = []
+
+
+@jobs.register('tests.record')
+def record(**payload):
+    calls.append(payload)
+
+
+@jobs.register('tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError('boom')
+
+
+@jobs.register('tests.tag')
+def create_tag(user_id, name):
+    Tag.objects.create(user_id=user_id, name=name)
+
+
+class JobQueueTests(TestCase):
+    """Test enqueueing, claiming and running jobs."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_unknown_name_rejected(self):
+        """Test a job needs a registered handler."""
+        with self.assertRaises(LookupError):
+            jobs.enqueue('tests.missing')
+
+    def test_claim_by_priority_then_age(self):
+        """Test higher priorities are claimed first, oldest first."""
+        first = jobs.enqueue('tests.record', {'n': 1})
+        urgent = jobs.enqueue('tests.record', {'n': 2}, priority=5)
+        second = jobs.enqueue('tests.record', {'n': 3})
+
+        claimed = [jobs.claim('worker') for _ in range(3)]
+
+        self.assertEqual(claimed, [urgent, first, second])
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_delayed_job_not_claimed(self):
+        """Test a job is not claimed before it is due."""
+        jobs.enqueue('tests.record', delay=60)
+
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_claimed_job_visible_after_timeout(self):
+        """Test a job whose worker never finished is claimed again."""
+        job = jobs.enqueue('tests.record')
+        jobs.claim('worker', timeout=60)
+        self.assertIsNone(jobs.claim('other'))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        again = jobs.claim('other')
+
+        self.assertEqual(again, job)
+        self.assertEqual(again.attempts, 2)
+        self.assertEqual(again.locked_by, 'other')
+
+    def test_success_deletes_job(self):
+        """Test a finished job runs its handler and leaves the queue."""
+        jobs.enqueue('tests.record', {'n': 1})
+
+        self.assertTrue(jobs.run_job(jobs.claim('worker')))
+
+        self.assertEqual(calls, [{'n': 1}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_retried_with_backoff(self):
+        """Test a failed job is queued again later with its error."""
+        jobs.enqueue('tests.fail')
+        before = timezone.now()
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertFalse(jobs.run_job(jobs.claim('worker')))
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('boom', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=5))
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_failure_after_max_attempts(self):
+        """Test a job failing every attempt is kept as failed."""
+        jobs.enqueue('tests.fail')
+        for _ in range(2):
+            Job.objects.update(run_at=timezone.now())
+            with self.assertLogs('core.jobs', 'ERROR'):
+                jobs.run_job(jobs.claim('worker'))
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_backoff_grows_and_is_capped(self):
+        """Test retry delays double up to the maximum."""
+        with self.settings(JOB_RETRY_BACKOFF=10, JOB_RETRY_BACKOFF_MAX=60):
+            self.assertTrue(5 <= jobs.backoff(1) <= 10)
+            self.assertTrue(20 <= jobs.backoff(3) <= 40)
+            self.assertTrue(30 <= jobs.backoff(10) <= 60)
+
+    def test_enqueue_rolled_back(self):
+        """Test a job queued in a transaction rolls back with it."""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                jobs.enqueue('tests.record')
+                raise RuntimeError
+
+        self.assertFalse(Job.objects.exists())
+
+
+class JobWorkerTests(TransactionTestCase):
+    """Test workers running the queue against the database."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def _queue_tags(self, count):
+        for i in range(count):
+            jobs.enqueue('tests.tag', {'user_id': self.user.id, 'name': i})
+
+    def test_work_burst_runs_due_jobs(self):
+        """Test a burst worker runs every due job and returns."""
+        self._queue_tags(3)
+
+        self.assertEqual(jobs.work('worker', burst=True), 3)
+
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertFalse(Job.objects.exists())
+
+    def test_run_workers_command(self):
+        """Test the command runs the queue in this process."""
+        self._queue_tags(2)
+
+        call_command(
+            'run_workers', '--workers=1', '--burst', stdout=StringIO(),
+        )
+
+        self.assertEqual(Tag.objects.count(), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs SKIP LOCKED')
+    def test_run_workers_processes(self):
+        """Test jobs are shared out between worker processes."""
+        self._queue_tags(6)
+
+        call_command(
+            'run_workers', '--workers=3', '--burst', stdout=StringIO(),
+        )
+
+        self.assertEqual(Tag.objects.count(), 6)
+        self.assertFalse(Job.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs SKIP LOCKED')
+    def test_claim_skips_locked_jobs(self):
+        """Test a claim skips a job another transaction has locked."""
+        locked = jobs.enqueue('tests.record', priority=5)
+        free = jobs.enqueue('tests.record')
+        holding, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                Job.objects.select_for_update().get(pk=locked.pk)
+                holding.set()
+                release.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        holding.wait(10)
+        try:
+            claimed = jobs.claim('worker')
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(claimed, free)
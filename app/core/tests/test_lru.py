@@ -0,0 +1,46 @@
+"""
+Tests for the bounded in-process cache.
+"""
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.lru import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+    """Test the bounded in-process cache."""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache keeps at most max_size entries."""
+        lru = LRUCache()
+        lru.set('a', 1, max_size=2)
+        lru.set('b', 2, max_size=2)
+        lru.get('a')
+        lru.set('c', 3, max_size=2)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_ttl_expires_entry(self):
+        """Test entries with a ttl expire and entries without one stay."""
+        lru = LRUCache()
+        with patch('core.lru.time.monotonic', return_value=0):
+            lru.set('a', 1, max_size=10, ttl=60)
+            lru.set('b', 2, max_size=10)
+
+        with patch('core.lru.time.monotonic', return_value=61):
+            self.assertIsNone(lru.get('a'))
+            self.assertEqual(lru.get('b'), 2)
+
+    def test_delete_owner(self):
+        """Test removing all entries of one owner."""
+        lru = LRUCache()
+        lru.set('a', 1, max_size=10, owner=1)
+        lru.set('b', 2, max_size=10, owner=2)
+
+        lru.delete_owner(1)
+
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.get('b'), 2)
@@ -4,6 +4,7 @@ Tests for models
 from unittest.mock import patch
 from decimal import Decimal  # to store values
 
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -101,6 +102,18 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
+    def test_tag_and_ingredient_names_unique_per_user(self):
+        """Test a user cannot have two tags or ingredients with one name"""
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        for model in (models.Tag, models.Ingredient):
+            model.objects.create(user=user, name='Same')
+            # another user may reuse the name
+            model.objects.create(user=other_user, name='Same')
+
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                model.objects.create(user=user, name='Same')
+
 # uuid4() is typically used to generate a random unique identifier
 # dacorator to patching or replacing the actual uuid4 function with
 # a "mocked" version for the duration of the test
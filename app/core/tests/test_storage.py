@@ -0,0 +1,105 @@
+"""
+Tests for the content addressed storage.
+"""
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from core.models import MediaBlob, Recipe
+from core.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Test uploads are stored once and reference counted."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(
+            MEDIA_ROOT=self.media_root, MEDIA_BLOB_GRACE_SECONDS=0,
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def _recipe_with_image(self, content=b'image bytes'):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        recipe.image.save('photo.JPG', ContentFile(content))
+        return recipe
+
+    def test_named_by_content_hash(self):
+        """Test a saved file is named after its SHA-256."""
+        name = default_storage.save('uploads/a.JPG', ContentFile(b'abc'))
+
+        digest = (
+            'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
+        )
+        self.assertEqual(name, f'blobs/ba/78/{digest}.jpg')
+        self.assertTrue(default_storage.exists(name))
+
+    def test_duplicate_upload_skips_write(self):
+        """Test a known image is reused without writing it again."""
+        first = self._recipe_with_image()
+
+        with patch.object(ContentAddressedStorage, '_write') as write:
+            second = self._recipe_with_image()
+
+        write.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        blob = MediaBlob.objects.get(name=first.image.name)
+        self.assertEqual(blob.refcount, 2)
+
+    def test_blob_removed_with_last_reference(self):
+        """Test a blob is kept until no recipe uses it."""
+        first = self._recipe_with_image()
+        second = self._recipe_with_image()
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replaced_image_released(self):
+        """Test uploading a new image frees the old one."""
+        recipe = self._recipe_with_image(b'old')
+        old_path = recipe.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save('photo.jpg', ContentFile(b'new'))
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(
+            MediaBlob.objects.get(name=recipe.image.name).refcount, 1,
+        )
+
+    def test_grace_period_keeps_recent_blobs(self):
+        """Test an unreferenced blob touched recently is kept."""
+        recipe = self._recipe_with_image()
+        path = recipe.image.path
+
+        with override_settings(MEDIA_BLOB_GRACE_SECONDS=3600):
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(MediaBlob.objects.get().refcount, 0)
@@ -0,0 +1,73 @@
+"""
+Tests for the bounded upload handler.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Recipe
+from core.uploads import MaxSizeUploadHandler, UploadTooLarge
+
+
+@override_settings(UPLOAD_MAX_BYTES=100)
+class MaxSizeUploadHandlerTests(SimpleTestCase):
+    """Test uploads are cut off at the size limit."""
+
+    def test_chunks_counted_without_content_length(self):
+        """Test the limit holds when the declared length is wrong."""
+        handler = MaxSizeUploadHandler()
+        handler.handle_raw_input(None, {}, 10, b'boundary')
+
+        self.assertEqual(handler.receive_data_chunk(b'x' * 60, 0), b'x' * 60)
+        with self.assertRaises(UploadTooLarge):
+            handler.receive_data_chunk(b'x' * 60, 60)
+
+    def test_declared_length_rejected_up_front(self):
+        """Test a too large Content-Length fails before reading."""
+        handler = MaxSizeUploadHandler()
+
+        with self.assertRaises(UploadTooLarge):
+            handler.handle_raw_input(None, {}, 10 ** 9, b'boundary')
+
+
+@override_settings(UPLOAD_MAX_BYTES=100)
+class UploadLimitMiddlewareTests(TestCase):
+    """Test too large uploads outside the API are answered with 413."""
+
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123',
+        )
+        self.recipe = Recipe.objects.create(
+            user=admin, title='Soup', time_minutes=5, price=Decimal('1.00'),
+        )
+        self.url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+        self.admin = admin
+
+    def _post(self, client):
+        client.force_login(self.admin)
+        return client.post(self.url, {
+            'image': SimpleUploadedFile('soup.jpg', b'x' * 200),
+        })
+
+    def test_admin_upload_too_large(self):
+        """Test an oversized admin upload is rejected in the view."""
+        res = self._post(Client())
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    def test_upload_too_large_before_csrf_check(self):
+        """Test the size is checked before the CSRF check reads the form."""
+        res = self._post(Client(enforce_csrf_checks=True))
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
@@ -0,0 +1,110 @@
+"""
+Bounded upload handling
+"""
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+
+from PIL import Image, UnidentifiedImageError
+
+from rest_framework import exceptions, status
+from rest_framework.views import exception_handler as drf_exception_handler
+
+
+# room for the multipart boundaries and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(RequestDataTooBig):
+    """The request body is larger than UPLOAD_MAX_BYTES."""
+
+
+class UploadTooLargeError(exceptions.APIException):
+    """API error for an UploadTooLarge raised while parsing a request."""
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('Upload is too large.')
+    default_code = 'upload_too_large'
+
+
+def exception_handler(exc, context):
+    """DRF exception handler answering too large uploads with 413."""
+    if isinstance(exc, UploadTooLarge):
+        exc = UploadTooLargeError()
+    return drf_exception_handler(exc, context)
+
+
+class UploadLimitMiddleware:
+    """Answer too large uploads outside the API with 413.
+
+    Django would answer the RequestDataTooBig raised by the upload
+    handler with a 400.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # CsrfViewMiddleware reads the form of a POST before the view;
+        # API views are csrf exempt and parse their own body
+        if (request.method == 'POST'
+                and request.content_type == 'multipart/form-data'
+                and not getattr(view_func, 'csrf_exempt', False)):
+            try:
+                request.POST
+            except UploadTooLarge:
+                return self._too_large()
+        return None
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, UploadTooLarge):
+            return self._too_large()
+        return None
+
+    def _too_large(self):
+        return HttpResponse(
+            UploadTooLargeError.default_detail,
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Reject uploads over UPLOAD_MAX_BYTES before they are stored.
+
+    Passes chunks on to the next handler, which streams them to disk.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # a declared length over the limit fails before reading the body
+        if content_length > settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD:
+            raise UploadTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        # the declared length can be missing or wrong, so count the bytes
+        if start + len(raw_data) > settings.UPLOAD_MAX_BYTES:
+            raise UploadTooLarge()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def read_image_header(file):
+    """Return (format, (width, height)) read from the image header.
+
+    Pillow's open is lazy, so no pixel data is decoded here.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            info = image.format, image.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+    finally:
+        file.seek(0)
+    return info
@@ -0,0 +1,30 @@
+"""
+Views for service health
+"""
+from django.db import DatabaseError, connection
+
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.db.pool import pool_stats
+
+
+class HealthView(APIView):
+    """Report whether the database answers, with this process's pools."""
+# polled by load balancers and orchestrators, without credentials
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return Response(
+                {'database': 'unavailable'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        # waits, timeouts and idle connections of each pool
+        return Response({'database': 'ok', 'pools': pool_stats()})
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RecipeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe'
+
+    def ready(self):
+        # connects the cache invalidation receivers
+        from recipe import signals  # noqa: F401
+        # registers the image variants job handler
+        from recipe import variants  # noqa: F401
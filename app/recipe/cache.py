@@ -0,0 +1,139 @@
+"""
+Per-user response caching for recipe APIs
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.db.routers import pin_primary
+
+
+def _version_key(user_id):
+    return f'recipe:version:{user_id}'
+
+
+def _initial_version():
+    # a fresh counter starts from the clock so it never repeats a version
+    # that was in use before the key was evicted
+    return int(time.time() * 1000)
+
+
+def get_version(user_id):
+    """Return the current cache version of a user's recipe data."""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_id):
+    key = _version_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # key was evicted or never set
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.get(key)
+
+
+def bump_version(user_id, on_commit=None):
+    """Invalidate everything cached for a user's recipe data.
+
+    on_commit is called with the version that follows the commit.
+    """
+    version = _bump(user_id)
+    # the replicas may not have the change yet, workers included
+    pin_primary(user_id)
+    # bump again once the transaction commits, so a read that ran
+    # before the commit cannot keep stale data under the new version
+    if transaction.get_connection().in_atomic_block:
+        def committed():
+            committed_version = _bump(user_id)
+            pin_primary(user_id)
+            if on_commit is not None:
+                on_commit(committed_version)
+        transaction.on_commit(committed)
+    elif on_commit is not None:
+        on_commit(version)
+    return version
+
+
+def _request_digest(request):
+    """Return a digest of the user, their data version and the URL."""
+    version = get_version(request.user.pk)
+    return hashlib.sha1(
+        f'{request.user.pk}:{version}:{request.build_absolute_uri()}'.encode()
+    ).hexdigest()
+
+
+def response_cache_key(request):
+    """Return the cache key of a GET request for the current version."""
+    return f'recipe:response:{request.user.pk}:{_request_digest(request)}'
+
+
+def response_etag(request):
+    """Return a strong ETag for a GET request, without rendering it."""
+    return f'"{_request_digest(request)}"'
+
+
+class CachedListMixin:
+    """Serve list responses from the cache until the user's data changes."""
+
+    def _cached(self, handler, request, *args, **kwargs):
+        """Return the cached response data or call handler and cache it."""
+        timeout = settings.RECIPE_LIST_CACHE_TIMEOUT
+        if not timeout:
+            return handler(request, *args, **kwargs)
+        # the key is taken before querying, so a write that lands while
+        # the response is built bumps the version past this entry
+        key = response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Return the cached list response or build and cache it."""
+        return self._cached(super().list, request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """Answer list and retrieve with 304 when the client's ETag matches."""
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        """Return 304 for a matching If-None-Match or call handler."""
+        # the ETag comes from the user's data version, so a match is
+        # answered without querying or serializing anything
+        etag = response_etag(request)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED,
+        ):
+            response['ETag'] = etag
+            # clients may keep the body but must revalidate it
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
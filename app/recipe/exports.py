@@ -0,0 +1,77 @@
+"""
+Streaming exports of recipes
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import prefetch_related_objects
+
+from recipe.serializers import RecipeDetailSerializer
+
+
+# recipes read from the server-side cursor per round trip
+CHUNK_SIZE = 500
+
+CSV_FIELDS = [
+    'id', 'title', 'description', 'time_minutes', 'price',
+    'link', 'image', 'tags', 'ingredients',
+]
+
+
+def iter_recipe_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Yield lists of serialized recipes, one chunk at a time."""
+    # iterator() streams rows from a server-side cursor but ignores
+    # prefetch_related, so relations are prefetched chunk by chunk
+    chunk = []
+    for recipe in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(recipe)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _serialized(queryset, context, chunk_size):
+    """Yield recipe dicts with only one chunk held in memory."""
+    for chunk in iter_recipe_chunks(queryset, chunk_size):
+        prefetch_related_objects(chunk, 'tags', 'ingredients')
+        yield from RecipeDetailSerializer(
+            chunk, many=True, context=context,
+        ).data
+
+
+def ndjson_rows(queryset, context, chunk_size=CHUNK_SIZE):
+    """Yield one JSON document per line for every recipe."""
+    for item in _serialized(queryset, context, chunk_size):
+        yield json.dumps(item, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    """File-like object that returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(queryset, context, chunk_size=CHUNK_SIZE):
+    """Yield CSV lines for every recipe, relations joined by ';'."""
+    # nested fields like image_variants have no flat CSV form
+    writer = csv.DictWriter(
+        _Echo(), fieldnames=CSV_FIELDS, extrasaction='ignore',
+    )
+    yield writer.writeheader()
+    for item in _serialized(queryset, context, chunk_size):
+        item['tags'] = ';'.join(tag['name'] for tag in item['tags'])
+        item['ingredients'] = ';'.join(
+            ingredient['name'] for ingredient in item['ingredients']
+        )
+        yield writer.writerow(item)
+
+
+# export_format -> (row generator, content type)
+FORMATS = {
+    'ndjson': (ndjson_rows, 'application/x-ndjson'),
+    'csv': (csv_rows, 'text/csv'),
+}
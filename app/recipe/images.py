@@ -0,0 +1,45 @@
+"""
+Resized variants of recipe images
+"""
+import io
+
+from PIL import Image, ImageOps
+
+
+# variant name -> longest side in pixels
+VARIANTS = {
+    'thumb': 160,
+    'small': 480,
+    'medium': 1024,
+}
+
+# file extension -> Pillow format and save options
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def render_variants(path):
+    """Return {variant: {extension: bytes}} for the image at path.
+
+    Runs in a worker process, so it only touches the file and Pillow.
+    """
+    with Image.open(path) as original:
+        # phone photos are stored sideways with an EXIF rotation
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    rendered = {}
+    for name, size in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+        rendered[name] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            if image_format == 'JPEG' and variant.mode != 'RGB':
+                variant = variant.convert('RGB')
+            buffer = io.BytesIO()
+            variant.save(buffer, image_format, **options)
+            rendered[name][extension] = buffer.getvalue()
+    return rendered
@@ -0,0 +1,306 @@
+"""
+In-process indexes over a user's recipes
+"""
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+
+from core.lru import LRUCache
+from core.models import Recipe
+from recipe.cache import bump_version, get_version
+
+
+def _links(relation, user_id):
+    """Return (related id, recipe id) rows of a user's recipe relation."""
+    through = getattr(Recipe, relation).through
+    field = Recipe._meta.get_field(relation).m2m_reverse_field_name()
+    return through.objects.filter(
+        recipe__user_id=user_id, recipe__deleted_at__isnull=True,
+    ).order_by(f'{field}_id', 'recipe_id').values_list(
+        f'{field}_id', 'recipe_id',
+    ).iterator()
+
+
+class PantryIndex:
+    """Inverted index from ingredient id to the recipes that use it."""
+
+    def __init__(self, version, postings, sizes):
+        # cache version of the user's data this index reflects
+        self.version = version
+        # ingredient id -> sorted array of recipe ids
+        self.postings = postings
+        # recipe id -> number of ingredients in the recipe
+        self.sizes = sizes
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, user_id, version):
+        """Load the index of a user from the database."""
+        postings = {}
+        sizes = Counter()
+        for ingredient_id, recipe_id in _links('ingredients', user_id):
+            postings.setdefault(ingredient_id, array('q')).append(recipe_id)
+            sizes[recipe_id] += 1
+        return cls(version, postings, sizes)
+
+    def link(self, relation, pairs):
+        """Link (related id, recipe id) pairs."""
+        if relation != 'ingredients':
+            return
+        for ingredient_id, recipe_id in pairs:
+            recipes = self.postings.setdefault(ingredient_id, array('q'))
+            i = bisect_left(recipes, recipe_id)
+            if i == len(recipes) or recipes[i] != recipe_id:
+                insort(recipes, recipe_id)
+                self.sizes[recipe_id] += 1
+
+    def unlink(self, relation, pairs):
+        """Unlink (related id, recipe id) pairs."""
+        if relation != 'ingredients':
+            return
+        for ingredient_id, recipe_id in pairs:
+            recipes = self.postings.get(ingredient_id, ())
+            i = bisect_left(recipes, recipe_id)
+            if i < len(recipes) and recipes[i] == recipe_id:
+                del recipes[i]
+                self.sizes[recipe_id] -= 1
+
+    def remove_recipe(self, recipe_id):
+        """Forget a deleted recipe."""
+        self.unlink(
+            'ingredients',
+            [(ingredient_id, recipe_id) for ingredient_id in self.postings],
+        )
+        self.sizes.pop(recipe_id, None)
+
+    def remove_related(self, relation, related_id):
+        """Forget a deleted tag or ingredient."""
+        if relation != 'ingredients':
+            return
+        for recipe_id in self.postings.pop(related_id, ()):
+            self.sizes[recipe_id] -= 1
+
+    def rank(self, ingredient_ids, min_coverage, limit):
+        """Return [(recipe id, coverage)] best covered first."""
+        # walks only the postings of the pantry's ingredients
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(self.postings.get(ingredient_id, ()))
+        ranked = []
+        for recipe_id, count in matched.items():
+            coverage = count / self.sizes[recipe_id]
+            if coverage >= min_coverage:
+                ranked.append((coverage, count, recipe_id))
+        ranked.sort(reverse=True)
+        return [(recipe_id, coverage)
+                for coverage, _, recipe_id in ranked[:limit]]
+
+
+class SimilarityIndex:
+    """Sparse recipe x feature matrix of a user's tags and ingredients."""
+
+    relations = ('tags', 'ingredients')
+
+    def __init__(self, version, features):
+        self.version = version
+        # recipe id -> set of (relation, related id) features
+        self.features = features
+        self.lock = threading.Lock()
+        # (relation, related id) -> matrix column, columns are never reused
+        self._columns = {}
+        # recipes whose rows changed since the matrix was packed
+        self._dirty = set()
+        self._matrix = None
+
+    @classmethod
+    def build(cls, user_id, version):
+        """Load the index of a user from the database."""
+        features = {}
+        for relation in cls.relations:
+            for related_id, recipe_id in _links(relation, user_id):
+                features.setdefault(recipe_id, set()).add(
+                    (relation, related_id)
+                )
+        return cls(version, features)
+
+    def link(self, relation, pairs):
+        """Link (related id, recipe id) pairs."""
+        for related_id, recipe_id in pairs:
+            self.features.setdefault(recipe_id, set()).add(
+                (relation, related_id)
+            )
+            self._dirty.add(recipe_id)
+
+    def unlink(self, relation, pairs):
+        """Unlink (related id, recipe id) pairs."""
+        for related_id, recipe_id in pairs:
+            self.features.get(recipe_id, set()).discard(
+                (relation, related_id)
+            )
+            self._dirty.add(recipe_id)
+
+    def remove_recipe(self, recipe_id):
+        """Forget a deleted recipe."""
+        self.features.pop(recipe_id, None)
+        self._dirty.add(recipe_id)
+
+    def remove_related(self, relation, related_id):
+        """Forget a deleted tag or ingredient."""
+        feature = (relation, related_id)
+        for recipe_id, features in self.features.items():
+            if feature in features:
+                features.discard(feature)
+                self._dirty.add(recipe_id)
+
+    def _pack(self, recipe_ids):
+        """Return the CSR rows of the given recipes."""
+        indptr = [0]
+        indices = []
+        for recipe_id in recipe_ids.tolist():
+            for feature in self.features[recipe_id]:
+                indices.append(
+                    self._columns.setdefault(feature, len(self._columns))
+                )
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(recipe_ids), len(self._columns)),
+        )
+
+    def _compile(self):
+        """Pack the feature sets into a CSR matrix."""
+        if self._matrix is None:
+            recipe_ids = np.fromiter(sorted(self.features), dtype=np.int64)
+            matrix = self._pack(recipe_ids)
+        else:
+            # only the changed rows are packed again, the rest are taken
+            # over from the current matrix
+            recipe_ids, matrix, _ = self._matrix
+            dirty = np.fromiter(self._dirty, dtype=np.int64)
+            keep = ~np.isin(recipe_ids, dirty)
+            changed = np.fromiter(
+                sorted(set(self._dirty) & self.features.keys()),
+                dtype=np.int64,
+            )
+            rows = self._pack(changed)
+            matrix = matrix[keep]
+            matrix.resize(matrix.shape[0], rows.shape[1])
+            recipe_ids = np.concatenate([recipe_ids[keep], changed])
+            order = np.argsort(recipe_ids, kind='stable')
+            recipe_ids = recipe_ids[order]
+            matrix = sparse.vstack([matrix, rows], format='csr')[order]
+        sizes = np.diff(matrix.indptr).astype(np.float32)
+        self._matrix = (recipe_ids, matrix, sizes)
+        self._dirty.clear()
+
+    def rank(self, recipe_id, metric, limit):
+        """Return [(recipe id, similarity)] most similar first."""
+        if self._matrix is None or self._dirty:
+            self._compile()
+        recipe_ids, matrix, sizes = self._matrix
+        row = np.searchsorted(recipe_ids, recipe_id)
+        if row == len(recipe_ids) or recipe_ids[row] != recipe_id:
+            return []
+        # one sparse mat-vec gives the shared feature count of every recipe
+        overlap = (matrix @ matrix[row].T).toarray().ravel()
+        if metric == 'cosine':
+            denominator = np.sqrt(sizes * sizes[row])
+        else:
+            denominator = sizes + sizes[row] - overlap
+        # recipes left without features share nothing, score them 0
+        scores = np.divide(
+            overlap, denominator,
+            out=np.zeros_like(overlap), where=denominator > 0,
+        )
+        scores[row] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            # keep every candidate tied with the limit-th best score, so
+            # the tie break below decides which of them make the cut
+            cutoff = -np.partition(-scores[candidates], limit - 1)[limit - 1]
+            candidates = candidates[scores[candidates] >= cutoff]
+        # best score first, newest recipe first among equal scores
+        order = np.lexsort((-recipe_ids[candidates], -scores[candidates]))
+        return [(int(recipe_ids[i]), float(scores[i]))
+                for i in candidates[order][:limit]]
+
+
+class IndexRegistry:
+    """Indexes of recently active users in this process."""
+
+    def __init__(self, index_class):
+        self.index_class = index_class
+        self._indexes = LRUCache()
+
+    def get(self, user_id):
+        """Return the user's index, rebuilt if their data changed."""
+        index = self._indexes.get(user_id)
+        version = get_version(user_id)
+        if index is None or index.version != version:
+            # the version is read first, so a write committing while the
+            # rows are read leaves the index one version behind
+            index = self.index_class.build(user_id, version)
+            self._store(user_id, index)
+        return index
+
+    def rank(self, user_id, *args):
+        """Call rank on the user's index."""
+        index = self.get(user_id)
+        with index.lock:
+            return index.rank(*args)
+
+    def _store(self, user_id, index):
+        # entries only leave by eviction, staleness is checked on read
+        self._indexes.set(user_id, index, settings.RECIPE_INDEX_SIZE)
+
+    def advance(self, user_id, version, change=None):
+        """Apply change to the user's index and move it to version.
+
+        An index that missed a version in between is dropped instead.
+        """
+        index = self._indexes.get(user_id)
+        if index is None:
+            return
+        with index.lock:
+            if index.version == version:
+                return
+            if index.version != version - 1:
+                self._indexes.delete(user_id)
+                return
+            if change is not None:
+                change(index)
+            index.version = version
+
+    def clear(self):
+        """Drop every index."""
+        self._indexes.clear()
+
+
+pantry_indexes = IndexRegistry(PantryIndex)
+similarity_indexes = IndexRegistry(SimilarityIndex)
+registries = (pantry_indexes, similarity_indexes)
+
+
+def _advance(user_id, version, change=None):
+    for registry in registries:
+        registry.advance(user_id, version, change)
+
+
+def record_change(user_id, change=None):
+    """Bump the user's version, keeping this process's indexes current.
+
+    change(index) is applied once the write commits; other processes
+    see the new version and rebuild their indexes.
+    """
+    version = bump_version(
+        user_id, on_commit=lambda v: _advance(user_id, v, change),
+    )
+    # nothing is committed yet, so the indexes stay valid as they are for
+    # every other transaction; only the writing one reads them stale
+    _advance(user_id, version)
@@ -0,0 +1,186 @@
+"""
+Serving recipe images to their owners
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from core.models import Recipe
+from core.storage import BLOB_DIR
+from recipe.images import FORMATS, VARIANTS
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# bytes read per chunk when streaming part of a file
+CHUNK_SIZE = 64 * 1024
+# content addressed names never change content, so clients keep them
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def references(names):
+    """Return a filter for recipes using any of names as image or variant."""
+    query = Q(image__in=names)
+    for name in VARIANTS:
+        for extension in FORMATS:
+            query |= Q(**{f'image_variants__{name}__{extension}__in': names})
+    return query
+
+
+def referenced_names(chunk_size=2000):
+    """Return every name some recipe uses as image or variant."""
+    found = set()
+    last = 0
+    while True:
+        # walks the primary key index once, one chunk per query
+        # deleted recipes keep their files until they are purged
+        rows = list(Recipe.all_objects.filter(pk__gt=last).order_by(
+            'pk',
+        ).values_list('pk', 'image', 'image_variants')[:chunk_size])
+        for last, image, variants in rows:
+            found.add(image)
+            for files in variants.values():
+                found.update(files.values())
+        if len(rows) < chunk_size:
+            break
+    found.discard('')
+    return found
+
+
+def _etag(path, stat):
+    """Return a strong ETag, the content hash for content named files."""
+    if path.startswith(f'{BLOB_DIR}/'):
+        digest = os.path.splitext(os.path.basename(path))[0]
+        return f'"{digest}"', True
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', False
+
+
+def parse_range(header, size):
+    """Return (start, end) of a single byte range, None for the whole
+    file, or False when the range can't be satisfied."""
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        # missing, malformed or multiple ranges: send the whole file
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N is the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class MediaView(APIView):
+    """Serve an uploaded file to the owner of a recipe using it."""
+# images are private, so only users with a recipe referencing the file
+# get it; the same blob can be shared by several users' recipes
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path):
+        if not Recipe.objects.filter(
+            references([path]), user=request.user,
+        ).exists():
+            raise Http404
+        try:
+            full_path = default_storage.path(path)
+            stat = os.stat(full_path)
+        except (SuspiciousFileOperation, FileNotFoundError):
+            raise Http404
+        etag, immutable = _etag(path, stat)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = self._file_response(request, path, full_path, stat,
+                                           etag)
+        response['ETag'] = etag
+        if immutable:
+            patch_cache_control(
+                response, private=True, max_age=IMMUTABLE_MAX_AGE,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def _file_response(self, request, path, full_path, stat, etag):
+        """Return the file, handed to the front proxy when configured."""
+        content_type = mimetypes.guess_type(path)[0]
+        content_type = content_type or 'application/octet-stream'
+        backend = settings.MEDIA_SENDFILE_BACKEND
+        if backend == 'nginx':
+            # nginx serves the file, ranges included, from an internal
+            # location mapped to MEDIA_ROOT
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = (
+                settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path
+            )
+            return response
+        if backend == 'sendfile':
+            # Apache mod_xsendfile and lighttpd
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+            return response
+
+        size = stat.st_size
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range is False:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            )
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range is None:
+            # served with the server's file wrapper (sendfile) if any
+            response = FileResponse(
+                open(full_path, 'rb'), content_type=content_type,
+            )
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(full_path, start, end),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+        return response
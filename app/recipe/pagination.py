@@ -0,0 +1,31 @@
+"""
+Pagination for recipe APIs
+"""
+from rest_framework.pagination import CursorPagination
+
+
+# CursorPagination is keyset pagination: the opaque cursor encodes the last
+# position seen, so every page is a `WHERE id < position LIMIT n` query and
+# page N costs the same as page 1 (OFFSET pagination scans all skipped rows)
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination for recipes ordered by newest first."""
+    ordering = '-id'
+    page_size = 100
+    # clients can ask for smaller or larger pages up to max_page_size
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    # ranked search results page on relevance first
+    rank_ordering = ('-rank', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        """Return the rank ordering for ranked querysets."""
+        if 'rank' in queryset.query.annotations:
+            return self.rank_ordering
+        return super().get_ordering(request, queryset, view)
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """Keyset pagination for tags and ingredients ordered by name."""
+    # names are unique per user, so name alone is a stable keyset and
+    # the (user, name) unique index returns rows already in order
+    ordering = '-name'
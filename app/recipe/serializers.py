@@ -1,12 +1,36 @@
 """
 Serializers for recipe APIs
 """
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from core.models import Recipe, Tag, Ingredient
+from core.uploads import read_image_header
+
+
+class RecipeAttrSerializer(serializers.ModelSerializer):
+    """Base serializer for tags and ingredients."""
+
+    def validate_name(self, value):
+        """Reject renaming to a name the user already has."""
+        # nested in a recipe, an existing name means reuse that row
+        if self.instance is not None:
+            duplicate = type(self.instance).objects.filter(
+                user=self.instance.user, name=value,
+            ).exclude(pk=self.instance.pk)
+            if duplicate.exists():
+                raise serializers.ValidationError(
+                    f'"{value}" already exists.'
+                )
+        return value
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecipeAttrSerializer):
     """Serializer for ingredients."""
 
     class Meta:
@@ -15,7 +39,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(RecipeAttrSerializer):
     """Serializers for tag"""
 
     class Meta:
@@ -24,6 +48,95 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Create and update many recipes with bulk queries."""
+
+    def _set_relations(self, recipes, relation, items, replace=True):
+        """Point each recipe's relation at the named objects."""
+        through = getattr(Recipe, relation).through
+        model = Recipe._meta.get_field(relation).related_model
+        column = f'{model._meta.model_name}_id'
+        # resolve the names of every recipe in the batch at once
+        objs = self.child._get_or_create_attrs(
+            model, [item for names in items for item in names],
+        )
+        by_name = {obj.name: obj.id for obj in objs}
+        wanted = {
+            recipe.id: {by_name[item['name']] for item in names}
+            for recipe, names in zip(recipes, items)
+        }
+        if replace:
+            # keep rows that are still wanted, delete the rest
+            stale = []
+            rows = through.objects.filter(
+                recipe_id__in=wanted,
+            ).values_list('id', 'recipe_id', column)
+            for row_id, recipe_id, obj_id in rows:
+                if obj_id in wanted[recipe_id]:
+                    wanted[recipe_id].discard(obj_id)
+                else:
+                    stale.append(row_id)
+            if stale:
+                through.objects.filter(id__in=stale).delete()
+        through.objects.bulk_create([
+            through(recipe_id=recipe_id, **{column: obj_id})
+            for recipe_id, obj_ids in wanted.items()
+            for obj_id in obj_ids
+        ])
+
+    def _save_relations(self, recipes, relations, replace=True):
+        """Save the popped tags and ingredients of each recipe."""
+        for relation in ('tags', 'ingredients'):
+            pairs = [
+                (recipe, items[relation])
+                for recipe, items in zip(recipes, relations)
+                if items[relation] is not None
+            ]
+            if pairs:
+                self._set_relations(
+                    [recipe for recipe, _ in pairs], relation,
+                    [names for _, names in pairs], replace=replace,
+                )
+
+    def create(self, validated_data):
+        """Create recipes with one INSERT per table."""
+        relations = [
+            {
+                'tags': attrs.pop('tags', None),
+                'ingredients': attrs.pop('ingredients', None),
+            }
+            for attrs in validated_data
+        ]
+        recipes = [Recipe(**attrs) for attrs in validated_data]
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                recipes = Recipe.objects.bulk_create(recipes)
+            else:
+                # without returned ids the through rows can't be linked
+                for recipe in recipes:
+                    recipe.save()
+            self._save_relations(recipes, relations, replace=False)
+        return recipes
+
+    def update(self, recipes, validated_data):
+        """Update recipes, pairing instances and items by position."""
+        relations = []
+        fields = set()
+        for recipe, attrs in zip(recipes, validated_data):
+            relations.append({
+                'tags': attrs.pop('tags', None),
+                'ingredients': attrs.pop('ingredients', None),
+            })
+            for attr, value in attrs.items():
+                setattr(recipe, attr, value)
+                fields.add(attr)
+        with transaction.atomic():
+            if fields:
+                Recipe.objects.bulk_update(recipes, fields)
+            self._save_relations(recipes, relations)
+        return recipes
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializers for recipe"""
     # many=True means tags will be a list
@@ -37,36 +150,55 @@ class RecipeSerializer(serializers.ModelSerializer):
                    'link', 'tags', 'ingredients',
                  ]
         read_only_fields = ['id']
+        # RecipeSerializer(many=True) saves with bulk queries
+        list_serializer_class = RecipeListSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
-        """Handling getting or creating tags."""
+    def _get_or_create_attrs(self, model, items):
+        """Return user's objects for the given names, creating missing ones."""
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
+        # dict keeps the payload order and drops duplicate names
+        names = list(dict.fromkeys(item['name'] for item in items))
+        if not names:
+            return []
+        # one SELECT resolves every name that already exists
+        existing = {}
+        for obj in model.objects.filter(user=auth_user, name__in=names):
+            existing.setdefault(obj.name, obj)
+        missing = [
+            model(user=auth_user, name=name)
+            for name in names if name not in existing
+        ]
+        if missing:
+            # one INSERT for all new rows; names a concurrent request
+            # created first are skipped by the unique constraint and
+            # read back with the rows inserted here
+            model.objects.bulk_create(missing, ignore_conflicts=True)
+            created = model.objects.filter(
                 user=auth_user,
-                # **tag is same as name=tag['name']
-                **tag,
+                name__in=[obj.name for obj in missing],
             )
-            recipe.tags.add(tag_obj)
+            for obj in created:
+                existing.setdefault(obj.name, obj)
+        return [existing[name] for name in names]
+
+    def _get_or_create_tags(self, tags, recipe):
+        """Handling getting or creating tags."""
+        recipe.tags.add(*self._get_or_create_attrs(Tag, tags))
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handling getting or creating ingredients."""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                # **ingredient is same as name=tag['name']
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        recipe.ingredients.add(
+            *self._get_or_create_attrs(Ingredient, ingredients)
+        )
 
     def create(self, validated_data):
         """Create a recipe"""
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags, recipe)
+            self._get_or_create_ingredients(ingredients, recipe)
 
         return recipe
 
@@ -74,32 +206,110 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Update recipe."""
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
-        if tags is not None:
-            recipe.tags.clear()
-            self._get_or_create_tags(tags, recipe)
+        with transaction.atomic():
+            # set() diffs against the current rows and only deletes or
+            # inserts the through rows that actually changed
+            if tags is not None:
+                recipe.tags.set(self._get_or_create_attrs(Tag, tags))
 
-        if ingredients is not None:
-            recipe.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, recipe)
+            if ingredients is not None:
+                recipe.ingredients.set(
+                    self._get_or_create_attrs(Ingredient, ingredients)
+                )
 
-        for attr, value in validated_data.items():
-            setattr(recipe, attr, value)
-        recipe.save()
+            for attr, value in validated_data.items():
+                setattr(recipe, attr, value)
+            recipe.save()
         return recipe
 
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view."""
+    # resized copies of image for lists and previews
+    image_variants = serializers.SerializerMethodField()
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'image_variants',
+        ]
+
+    @extend_schema_field({
+        'type': 'object',
+        'additionalProperties': {
+            'type': 'object',
+            'additionalProperties': {'type': 'string', 'format': 'uri'},
+        },
+    })
+    def get_image_variants(self, recipe):
+        """Return {variant: {extension: url}} of the recipe image."""
+        request = self.context.get('request')
+        urls = {}
+        for name, files in recipe.image_variants.items():
+            urls[name] = {}
+            for extension, path in files.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[name][extension] = url
+        return urls
+
+
+class ImageHeaderField(serializers.ImageField):
+    """Image field validated from the header instead of a full decode."""
+    default_error_messages = {
+        'invalid_image': _('Upload a valid image. The file you uploaded '
+                           'was either not an image or a corrupted image.'),
+        'format': _('Unsupported image format {format}.'),
+        'dimensions': _('Image is {width}x{height}, larger than allowed.'),
+    }
+
+    def to_internal_value(self, data):
+        # FileField checks the name and size; Django's image validation,
+        # which opens and verifies the whole image, is skipped
+        file = serializers.FileField.to_internal_value(self, data)
+        header = read_image_header(file)
+        if header is None:
+            self.fail('invalid_image')
+        image_format, (width, height) = header
+        if image_format not in settings.IMAGE_UPLOAD_FORMATS:
+            self.fail('format', format=image_format)
+        max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+        if (width > max_side or height > max_side
+                or width * height > settings.IMAGE_UPLOAD_MAX_PIXELS):
+            self.fail('dimensions', width=width, height=height)
+        return file
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
+    image = ImageHeaderField(required=True)
 
     class Meta:
         model = Recipe
         fields = ['id', 'image']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}}
+
+
+class RecipeBulkSerializer(serializers.Serializer):
+    """Serializer for a batch of recipe operations."""
+    create = serializers.ListField(
+        child=serializers.DictField(), required=False, default=list,
+        max_length=1000,
+    )
+    update = serializers.ListField(
+        child=serializers.DictField(), required=False, default=list,
+        max_length=1000,
+    )
+    delete = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+        max_length=1000,
+    )
+
+    def validate_update(self, value):
+        """Check every update names the recipe it changes."""
+        ids = [item.get('id') for item in value]
+        if not all(isinstance(recipe_id, int) for recipe_id in ids):
+            raise serializers.ValidationError('Each update needs an id.')
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Duplicate recipe ids.')
+        return value
@@ -0,0 +1,66 @@
+"""
+Signal handlers for recipe APIs
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_version
+from recipe.indexes import record_change
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def invalidate_on_change(sender, instance, **kwargs):
+    """Invalidate the owner's cached responses."""
+    # none of these change which recipes use which tags or ingredients
+    record_change(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_on_recipe_delete(sender, instance, **kwargs):
+    """Invalidate cached responses and drop the recipe from the indexes."""
+    # the pk is cleared on the instance once the delete finishes
+    pk = instance.pk
+    record_change(instance.user_id, lambda index: index.remove_recipe(pk))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_attr_delete(sender, instance, **kwargs):
+    """Invalidate cached responses and drop the attribute from the indexes."""
+    relation = 'tags' if sender is Tag else 'ingredients'
+    pk = instance.pk
+    record_change(
+        instance.user_id,
+        lambda index: index.remove_related(relation, pk),
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_m2m_change(
+        sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached responses and update the indexes."""
+    # instance is the recipe, or the tag/ingredient for reverse changes;
+    # both belong to the same user
+    if action == 'post_clear':
+        # the cleared pairs are unknown here, so the indexes are rebuilt
+        bump_version(instance.user_id)
+    elif action in ('post_add', 'post_remove'):
+        relation = 'tags' if sender is Recipe.tags.through else 'ingredients'
+        if reverse:
+            pairs = [(instance.pk, recipe_id) for recipe_id in pk_set]
+        else:
+            pairs = [(related_id, instance.pk) for related_id in pk_set]
+        if action == 'post_add':
+            record_change(
+                instance.user_id,
+                lambda index: index.link(relation, pairs),
+            )
+        else:
+            record_change(
+                instance.user_id,
+                lambda index: index.unlink(relation, pairs),
+            )
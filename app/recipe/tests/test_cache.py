@@ -0,0 +1,187 @@
+"""
+Tests for the per-user response cache.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from recipe import cache as recipe_cache
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ResponseCacheTests(TestCase):
+    """Test cached list responses."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _get(self, url, **params):
+        """GET url and return the response and the queries it ran."""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res, ctx.captured_queries
+
+    def test_repeated_list_served_from_cache(self):
+        """Test a repeated list request does not query the database."""
+        create_recipe(user=self.user)
+        first, _ = self._get(RECIPES_URL)
+
+        second, queries = self._get(RECIPES_URL)
+
+        self.assertEqual(queries, [])
+        self.assertEqual(first.data, second.data)
+
+    def test_query_params_cached_separately(self):
+        """Test different query params use different cache entries."""
+        for _ in range(3):
+            create_recipe(user=self.user)
+        self._get(RECIPES_URL)
+
+        res, queries = self._get(RECIPES_URL, page_size=1)
+
+        self.assertNotEqual(queries, [])
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_recipe_save_invalidates(self):
+        """Test saving a recipe expires its owner's cached lists."""
+        recipe = create_recipe(user=self.user, title='Before')
+        self._get(RECIPES_URL)
+
+        recipe.title = 'After'
+        recipe.save()
+        res, _ = self._get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'After')
+
+    def test_m2m_change_invalidates(self):
+        """Test adding a tag to a recipe expires cached lists."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self._get(RECIPES_URL)
+
+        recipe.tags.add(tag)
+        res, _ = self._get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Vegan')
+
+    def test_tag_delete_invalidates(self):
+        """Test deleting a tag expires cached tag lists."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self._get(TAGS_URL)
+
+        tag.delete()
+        res, _ = self._get(TAGS_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_other_users_change_keeps_cache(self):
+        """Test another user's writes do not expire this user's cache."""
+        create_recipe(user=self.user)
+        self._get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+
+        create_recipe(user=other)
+        _, queries = self._get(RECIPES_URL)
+
+        self.assertEqual(queries, [])
+
+    def test_bump_version_after_eviction(self):
+        """Test a lost version key never reuses an older version."""
+        old = recipe_cache.get_version(self.user.pk)
+        cache.delete(f'recipe:version:{self.user.pk}')
+
+        self.assertGreaterEqual(recipe_cache.bump_version(self.user.pk), old)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag and If-None-Match handling on recipe endpoints."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_list_and_detail_have_etags(self):
+        """Test 200 responses carry a strong ETag."""
+        for url in (RECIPES_URL, detail_url(self.recipe.id)):
+            res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(res['ETag'].startswith('"'))
+
+    def test_matching_etag_returns_304_without_queries(self):
+        """Test a matching If-None-Match skips the database."""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(ctx.captured_queries, [])
+
+    def test_etag_changes_after_write(self):
+        """Test an update makes the old ETag stale."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        self.recipe.title = 'Changed'
+        self.recipe.save()
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['title'], 'Changed')
+
+    def test_etag_differs_per_url(self):
+        """Test list and detail responses get different ETags."""
+        list_etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=list_etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,45 @@
+"""
+Tests for rendering recipe image variants.
+"""
+import io
+import tempfile
+
+from PIL import Image
+
+from django.test import SimpleTestCase
+
+from recipe.images import VARIANTS, render_variants
+
+
+class RenderVariantsTests(SimpleTestCase):
+    """Test resizing images into variants."""
+
+    def _image_file(self, mode='RGB', size=(1200, 1800)):
+        image_file = tempfile.NamedTemporaryFile(suffix='.png')
+        Image.new(mode, size).save(image_file, format='PNG')
+        image_file.seek(0)
+        return image_file
+
+    def test_variants_fit_their_size(self):
+        """Test each variant's longest side matches its size."""
+        with self._image_file() as image_file:
+            rendered = render_variants(image_file.name)
+
+        for name, size in VARIANTS.items():
+            for extension, content in rendered[name].items():
+                with Image.open(io.BytesIO(content)) as variant:
+                    self.assertEqual(max(variant.size), size)
+                    self.assertEqual(
+                        variant.format,
+                        'WEBP' if extension == 'webp' else 'JPEG',
+                    )
+
+    def test_transparent_image(self):
+        """Test images with alpha are flattened for JPEG."""
+        with self._image_file(mode='RGBA', size=(50, 50)) as image_file:
+            rendered = render_variants(image_file.name)
+
+        with Image.open(io.BytesIO(rendered['thumb']['jpg'])) as variant:
+            self.assertEqual(variant.mode, 'RGB')
+            # smaller images are not enlarged
+            self.assertEqual(variant.size, (50, 50))
@@ -0,0 +1,202 @@
+"""
+Tests for the in-process recipe indexes.
+"""
+import warnings
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import bump_version
+from recipe.indexes import (
+    SimilarityIndex,
+    pantry_indexes,
+    similarity_indexes,
+)
+
+
+class PantryIndexTests(TestCase):
+    """Test the ingredient to recipe index is kept current."""
+
+    def setUp(self):
+        cache.clear()
+        pantry_indexes.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Pancakes',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        self.eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        self.milk = Ingredient.objects.create(user=self.user, name='Milk')
+
+    def test_m2m_change_updates_index_in_place(self):
+        """Test a committed link is applied without a rebuild."""
+        index = pantry_indexes.get(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.ingredients.add(self.eggs, self.milk)
+
+        self.assertIs(pantry_indexes.get(self.user.id), index)
+        self.assertEqual(
+            pantry_indexes.rank(self.user.id, [self.eggs.id], 0, 10),
+            [(self.recipe.id, 0.5)],
+        )
+
+    def test_reverse_change_and_ingredient_delete(self):
+        """Test links added from the ingredient side and deletes."""
+        pantry_indexes.get(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.eggs.recipe_set.add(self.recipe)
+            self.recipe.ingredients.add(self.milk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.delete()
+
+        self.assertEqual(
+            pantry_indexes.rank(self.user.id, [self.eggs.id], 1, 10),
+            [(self.recipe.id, 1.0)],
+        )
+
+    def test_unrecorded_write_rebuilds(self):
+        """Test a bump without a change makes the index reload."""
+        index = pantry_indexes.get(self.user.id)
+
+        bump_version(self.user.id)
+
+        self.assertIsNot(pantry_indexes.get(self.user.id), index)
+
+    def test_uncommitted_change_not_applied(self):
+        """Test uncommitted links never reach the index."""
+        index = pantry_indexes.get(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=False):
+            self.recipe.ingredients.add(self.eggs)
+
+        self.assertIs(pantry_indexes.get(self.user.id), index)
+        self.assertEqual(
+            pantry_indexes.rank(self.user.id, [self.eggs.id], 0, 10), [],
+        )
+
+
+class SimilarityIndexTests(TestCase):
+    """Test the recipe x feature matrix is kept current."""
+
+    def setUp(self):
+        cache.clear()
+        similarity_indexes.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=Decimal('2.50'),
+            )
+            for i in range(3)
+        ]
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+
+    def test_tag_change_updates_matrix_in_place(self):
+        """Test committed tag links are applied without a rebuild."""
+        first, second, third = self.recipes
+        index = similarity_indexes.get(self.user.id)
+        self.assertEqual(
+            similarity_indexes.rank(self.user.id, first.id, 'jaccard', 5),
+            [],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.recipe_set.add(first, second)
+
+        self.assertIs(similarity_indexes.get(self.user.id), index)
+        self.assertEqual(
+            similarity_indexes.rank(self.user.id, first.id, 'jaccard', 5),
+            [(second.id, 1.0)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+            third.tags.add(self.tag)
+
+        self.assertEqual(
+            similarity_indexes.rank(self.user.id, first.id, 'jaccard', 5),
+            [(third.id, 1.0)],
+        )
+
+    def test_ties_newest_first_and_limit(self):
+        """Test equal scores are ordered by newest recipe and capped."""
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+        first, second, third = self.recipes
+
+        self.assertEqual(
+            similarity_indexes.rank(self.user.id, first.id, 'cosine', 1),
+            [(third.id, 1.0)],
+        )
+
+    def test_changes_repack_only_changed_rows(self):
+        """Test the patched matrix ranks like one built from scratch."""
+        first, second, third = self.recipes
+        vegan = self.tag
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        for recipe in self.recipes:
+            recipe.tags.add(vegan)
+        first.tags.add(quick)
+        index = similarity_indexes.get(self.user.id)
+        similarity_indexes.rank(self.user.id, first.id, 'jaccard', 5)
+        _, matrix, _ = index._matrix
+
+        with self.captureOnCommitCallbacks(execute=True):
+            third.tags.add(quick)
+            second.tags.remove(vegan)
+
+        self.assertIs(similarity_indexes.get(self.user.id), index)
+        self.assertEqual(index._dirty, {second.id, third.id})
+        fresh = SimilarityIndex.build(self.user.id, index.version)
+        for recipe in self.recipes:
+            for metric in ('cosine', 'jaccard'):
+                self.assertEqual(
+                    similarity_indexes.rank(
+                        self.user.id, recipe.id, metric, 5,
+                    ),
+                    fresh.rank(recipe.id, metric, 5),
+                )
+        # the row of the untouched recipe is taken over as it was
+        self.assertEqual(
+            index._matrix[1][0].toarray().tolist(),
+            matrix[0].toarray().tolist(),
+        )
+
+    def test_recipe_without_features_scores_zero(self):
+        """Test a recipe left without tags scores 0 without warnings."""
+        first, second, _ = self.recipes
+        first.tags.add(self.tag)
+        second.tags.add(self.tag)
+        similarity_indexes.get(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.tags.remove(self.tag)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            for metric in ('cosine', 'jaccard'):
+                self.assertEqual(
+                    similarity_indexes.rank(self.user.id, first.id, metric, 5),
+                    [],
+                )
+                self.assertEqual(
+                    similarity_indexes.rank(
+                        self.user.id, second.id, metric, 5,
+                    ),
+                    [],
+                )
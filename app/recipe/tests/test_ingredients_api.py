@@ -16,8 +16,10 @@ from core.models import (
 )
 
 from recipe.serializers import IngredientSerializer
+from recipe.views import has_trigram
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+TYPEAHEAD_URL = reverse('recipe:ingredient-typeahead')
 
 
 def detail_url(ingredient_id):
@@ -60,7 +62,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredient_limited_to_user(self):
         """Test list of ingredients is limited to authenticate user"""
@@ -69,9 +71,9 @@ class PrivateIngredientsApiTests(TestCase):
         ingredient = Ingredient.objects.create(user=self.user, name="Pepper")
         res = self.client.get(INGREDIENTS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_update_ingredient(self):
         """Test updating an ingredient."""
@@ -114,8 +116,8 @@ class PrivateIngredientsApiTests(TestCase):
 
         s1 = IngredientSerializer(in1)
         s2 = IngredientSerializer(in2)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         """Test filtered ingredients return a unique list"""
@@ -138,4 +140,66 @@ class PrivateIngredientsApiTests(TestCase):
 # only return ingredients that are assigned to at least one recipe
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 #  response from your API contains exactly one ingredient
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+
+class IngredientTypeaheadTests(TestCase):
+    """Test the ingredient typeahead endpoint."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _names(self, **params):
+        res = self.client.get(TYPEAHEAD_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data]
+
+    def test_prefix_matches_ranked_by_usage(self):
+        """Test prefix matches come first, most used first."""
+        tomato = Ingredient.objects.create(user=self.user, name='Tomato')
+        Ingredient.objects.create(user=self.user, name='Tofu')
+        Ingredient.objects.create(user=self.user, name='Cherry tomato')
+        Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = Recipe.objects.create(
+            title='Salad',
+            time_minutes=5,
+            price=Decimal('4.50'),
+            user=self.user,
+        )
+        recipe.ingredients.add(tomato)
+
+        names = self._names(q='to')
+
+        self.assertEqual(names[:2], ['Tomato', 'Tofu'])
+        self.assertIn('Cherry tomato', names)
+        self.assertNotIn('Salt', names)
+
+    def test_typeahead_limited_to_user(self):
+        """Test only the user's ingredients are suggested."""
+        other = create_user(email='other@example.com')
+        Ingredient.objects.create(user=other, name='Basil')
+
+        self.assertEqual(self._names(prefix='ba'), [])
+
+    def test_limit(self):
+        """Test the number of suggestions is capped by limit."""
+        for name in ('Pea', 'Peach', 'Peanut', 'Pear'):
+            Ingredient.objects.create(user=self.user, name=name)
+
+        self.assertEqual(self._names(q='pea', limit=2), ['Pea', 'Peach'])
+
+    def test_empty_query_returns_nothing(self):
+        """Test no suggestions are returned without text."""
+        Ingredient.objects.create(user=self.user, name='Kale')
+
+        self.assertEqual(self._names(q=''), [])
+
+    def test_misspelled_name_matches(self):
+        """Test trigram similarity finds misspelled names."""
+        if not has_trigram('default'):
+            self.skipTest('pg_trgm is not installed')
+        Ingredient.objects.create(user=self.user, name='Tomato')
+
+        self.assertEqual(self._names(q='tomatoe'), ['Tomato'])
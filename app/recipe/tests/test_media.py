@@ -0,0 +1,149 @@
+"""
+Tests for serving uploaded recipe images.
+"""
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+
+CONTENT = b'0123456789'
+
+
+class MediaViewTests(TestCase):
+    """Test media files are served to recipe owners only."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(CONTENT))
+        self.url = self.recipe.image.url
+
+    def _content(self, res):
+        return b''.join(res.streaming_content)
+
+    def test_owner_gets_file_with_cache_headers(self):
+        """Test the owner receives the file as an immutable resource."""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._content(res), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+        digest = self.recipe.image.name.rsplit('/', 1)[1].split('.')[0]
+        self.assertEqual(res['ETag'], f'"{digest}"')
+
+    def test_variant_served(self):
+        """Test image variants are served like the image."""
+        name = default_storage.save('variant.webp', ContentFile(b'webp'))
+        self.recipe.image_variants = {'thumb': {'webp': name}}
+        self.recipe.save()
+
+        res = self.client.get(default_storage.url(name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._content(res), b'webp')
+
+    def test_other_user_gets_404(self):
+        """Test files of another user's recipes are hidden."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_auth_required(self):
+        """Test anonymous requests are rejected."""
+        res = APIClient().get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_range_requests(self):
+        """Test single byte ranges are answered with 206."""
+        for header, body, content_range in (
+            ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', b'89', 'bytes 8-9/10'),
+        ):
+            res = self.client.get(self.url, HTTP_RANGE=header)
+
+            self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(self._content(res), body)
+            self.assertEqual(res['Content-Range'], content_range)
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of the file gets 416."""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        )
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_sends_whole_file(self):
+        """Test a range for another version of the file is ignored."""
+        res = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._content(res), CONTENT)
+
+    def test_matching_etag_returns_304(self):
+        """Test a cached copy is revalidated without a body."""
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(
+        MEDIA_SENDFILE_BACKEND='nginx', MEDIA_ACCEL_PREFIX='/protected/',
+    )
+    def test_x_accel_redirect(self):
+        """Test nginx is told which file to send."""
+        res = self.client.get(self.url)
+
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected/{self.recipe.image.name}',
+        )
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='sendfile')
+    def test_x_sendfile(self):
+        """Test the file path is handed to the server."""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['X-Sendfile'], self.recipe.image.path)
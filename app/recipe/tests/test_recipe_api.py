@@ -2,24 +2,37 @@
 Tests for recipe APIs.
 """
 from decimal import Decimal
+import csv
+import io
+import json
 import tempfile
 import os
+import shutil
+from unittest import skipUnless
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core import jobs
 from core.models import (
+    Job,
     Recipe,
     Tag,
     Ingredient,
 )
 
+from recipe.indexes import pantry_indexes, similarity_indexes
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
@@ -27,6 +40,9 @@ from recipe.serializers import (
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+EXPORT_URL = reverse('recipe:recipe-export')
+PANTRY_URL = reverse('recipe:recipe-pantry')
 
 
 def detail_url(recipe_id):
@@ -34,6 +50,11 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 def image_upload_url(recipe_id):
     """Create and return upload URL."""
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
@@ -99,7 +120,7 @@ class PrivateRecipeApiTests(TestCase):
         # many=True tells we are passing list of items
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
 # a user can only see their own recipes
 # and not recipes created by other users
@@ -119,7 +140,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         """Test get recipe detail"""
@@ -131,6 +152,20 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(res.data, serializer.data)
 
+    def test_delete_recipe_soft_deletes(self):
+        """Test deleting a recipe hides it and leaves the row to purge."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        res = self.client.delete(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+        self.assertIsNotNone(Recipe.all_objects.get(id=recipe.id).deleted_at)
+        self.assertEqual(self.client.get(RECIPES_URL).data['results'], [])
+        res = self.client.get(reverse('recipe:tag-list'), {'assigned_only': 1})
+        self.assertEqual(res.data['results'], [])
+
     def test_create_recipe(self):
         """Test creating a recipe"""
         payload = {
@@ -217,6 +252,49 @@ class PrivateRecipeApiTests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def _count_create_queries(self, tag_count, ingredient_count):
+        """Return the number of queries used to create a recipe."""
+        payload = {
+            'title': 'Stew',
+            'time_minutes': 60,
+            'price': Decimal('7.50'),
+            'tags': [{'name': f'Tag {i}'} for i in range(tag_count)],
+            'ingredients': [
+                {'name': f'Ingredient {i}'} for i in range(ingredient_count)
+            ],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return len(ctx.captured_queries)
+
+    def test_create_recipe_query_count_constant(self):
+        """Test creating tags and ingredients does not query per item."""
+        few = self._count_create_queries(2, 2)
+        Tag.objects.all().delete()
+        Ingredient.objects.all().delete()
+        many = self._count_create_queries(15, 30)
+
+        self.assertEqual(few, many)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 30,
+        )
+
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test repeated tag names in a payload create one tag."""
+        payload = {
+            'title': 'Ramen',
+            'time_minutes': 20,
+            'price': Decimal('4.00'),
+            'tags': [{'name': 'Noodles'}, {'name': 'Noodles'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+
     def test_create_tag_on_update(self):
         """Test creating a tag when updating a recipe"""
         recipe = create_recipe(user=self.user)
@@ -243,6 +321,26 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(tag_lunch, recipe.tags.all())
         self.assertNotIn(tag_breakfast, recipe.tags.all())
 
+    def test_update_recipe_keeps_unchanged_tag_rows(self):
+        """Test updating tags only touches the changed through rows."""
+        recipe = create_recipe(user=self.user)
+        tag_keep = Tag.objects.create(user=self.user, name='Keep')
+        tag_drop = Tag.objects.create(user=self.user, name='Drop')
+        recipe.tags.add(tag_keep, tag_drop)
+        through = Recipe.tags.through
+        kept_row = through.objects.get(recipe=recipe, tag=tag_keep)
+
+        payload = {'tags': [{'name': 'Keep'}, {'name': 'New'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(through.objects.filter(id=kept_row.id).exists())
+        names = set(recipe.tags.values_list('name', flat=True))
+        self.assertEqual(names, {'Keep', 'New'})
+        self.assertEqual(
+            sorted(t['name'] for t in res.data['tags']), ['Keep', 'New'],
+        )
+
     def test_clear_recipe_tags(self):
         """Test clearing recipe tags"""
         tag = Tag.objects.create(user=self.user, name='Dessert')
@@ -364,9 +462,9 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredints"""
@@ -384,15 +482,500 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_match_all(self):
+        """Test match=all returns recipes having every tag and ingredient."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        onion = Ingredient.objects.create(user=self.user, name='Onion')
+        r1 = create_recipe(user=self.user, title='Curry')
+        r1.tags.add(vegan, quick)
+        r1.ingredients.add(onion)
+        r2 = create_recipe(user=self.user, title='Salad')
+        r2.tags.add(vegan)
+        r2.ingredients.add(onion)
+        r3 = create_recipe(user=self.user, title='Toast')
+        r3.tags.add(vegan, quick)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{vegan.id},{quick.id}',
+            'ingredients': str(onion.id),
+            'match': 'all',
+        })
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [r1.id],
+        )
+
+    def test_filter_match_any_not_repeated(self):
+        """Test a recipe with several matching tags is listed once."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(vegan, quick)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(
+                RECIPES_URL, {'tags': f'{vegan.id},{quick.id}'},
+            )
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe.id],
+        )
+        self.assertFalse(
+            any('DISTINCT' in q['sql'] for q in ctx.captured_queries)
+        )
+
+    def test_filter_invalid_match(self):
+        """Test an unknown match mode is rejected."""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_paginated_by_cursor(self):
+        """Test recipes are returned in cursor pages ordered by -id."""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [recipes[4].id, recipes[3].id])
+        self.assertIsNone(res.data['previous'])
+        self.assertIsNotNone(res.data['next'])
+
+    def test_list_cursor_walks_all_recipes(self):
+        """Test following next cursors returns every recipe once."""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        seen = []
+        url = f'{RECIPES_URL}?page_size=2'
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(seen, [r.id for r in reversed(recipes)])
+
+    def test_search_title_and_description(self):
+        """Test searching recipes by words in title or description."""
+        r1 = create_recipe(user=self.user, title='Tomato soup')
+        r2 = create_recipe(
+            user=self.user, title='Pasta', description='With tomato sauce',
+        )
+        create_recipe(user=self.user, title='Pancakes', description='Sweet')
+        create_recipe(
+            user=create_user(email='o@example.com', password='pw123'),
+            title='Tomato salad',
+        )
+
+        res = self.client.get(RECIPES_URL, {'search': 'tomato'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = {item['id'] for item in res.data['results']}
+        self.assertEqual(ids, {r1.id, r2.id})
+
+    def test_search_combines_with_tag_filter(self):
+        """Test search results are narrowed by the tags filter."""
+        r1 = create_recipe(user=self.user, title='Tomato soup')
+        create_recipe(user=self.user, title='Tomato pie')
+        tag = Tag.objects.create(user=self.user, name='Soup')
+        r1.tags.add(tag)
+
+        res = self.client.get(
+            RECIPES_URL, {'search': 'tomato', 'tags': str(tag.id)},
+        )
+
+        self.assertEqual([item['id'] for item in res.data['results']], [r1.id])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Ranking needs PostgreSQL')
+    def test_search_ranked_by_relevance(self):
+        """Test title matches rank above description matches."""
+        in_title = create_recipe(user=self.user, title='Curry', description='')
+        in_desc = create_recipe(
+            user=self.user, title='Rice bowl', description='Curries on top',
+        )
+        # newer recipe would come first when ordered by -id
+        self.assertGreater(in_desc.id, in_title.id)
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry'})
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [in_title.id, in_desc.id])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Ranking needs PostgreSQL')
+    def test_search_cursor_walks_ranked_results(self):
+        """Test ranked search pages return every match once."""
+        recipes = [
+            create_recipe(
+                user=self.user,
+                title='Soup ' * (i % 3 + 1),
+                description='soup' if i % 2 else '',
+            )
+            for i in range(7)
+        ]
+
+        seen = []
+        url = f'{RECIPES_URL}?search=soup&page_size=2'
+        while url:
+            res = self.client.get(url)
+            seen.extend(item['id'] for item in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(sorted(seen), [r.id for r in recipes])
+
+    def _count_queries(self, url):
+        """Return the number of queries used to GET url."""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def _create_recipe_with_relations(self):
+        """Create a recipe with a tag and an ingredient."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name=f'Tag {recipe.id}')
+        )
+        recipe.ingredients.add(
+            Ingredient.objects.create(
+                user=self.user, name=f'Ingredient {recipe.id}',
+            )
+        )
+        return recipe
+
+    def test_list_query_count_constant(self):
+        """Test listing recipes uses a fixed number of queries."""
+        for _ in range(2):
+            self._create_recipe_with_relations()
+        few = self._count_queries(RECIPES_URL)
+
+        for _ in range(10):
+            self._create_recipe_with_relations()
+        many = self._count_queries(RECIPES_URL)
+
+        self.assertEqual(few, many)
+
+
+class BulkRecipeApiTests(TestCase):
+    """Test the bulk recipe endpoint."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create(self):
+        """Test creating many recipes with shared tags."""
+        payload = {
+            'create': [
+                {
+                    'title': f'Recipe {i}',
+                    'time_minutes': 10,
+                    'price': '1.50',
+                    'tags': [{'name': 'Quick'}, {'name': f'Tag {i}'}],
+                    'ingredients': [{'name': 'Salt'}],
+                }
+                for i in range(3)
+            ],
+        }
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['create']), 3)
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        for item in res.data['create']:
+            recipe = recipes.get(id=item['id'])
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+
+    def test_bulk_update_and_delete(self):
+        """Test updating and deleting recipes in one batch."""
+        r1 = create_recipe(user=self.user, title='Old title')
+        r1.tags.add(Tag.objects.create(user=self.user, name='Old'))
+        r2 = create_recipe(user=self.user)
+        r3 = create_recipe(user=self.user)
+
+        payload = {
+            'update': [
+                {'id': r1.id, 'title': 'New title', 'tags': [{'name': 'New'}]},
+                {'id': r2.id, 'time_minutes': 99},
+            ],
+            'delete': [r3.id],
+        }
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.title, 'New title')
+        self.assertEqual(
+            list(r1.tags.values_list('name', flat=True)), ['New'],
+        )
+        self.assertEqual(r2.time_minutes, 99)
+        self.assertFalse(Recipe.objects.filter(id=r3.id).exists())
+        self.assertTrue(Recipe.all_objects.filter(id=r3.id).exists())
+        self.assertEqual(res.data['delete'], [r3.id])
+
+    def test_bulk_invalid_item_rolls_back(self):
+        """Test an invalid item reports errors and saves nothing."""
+        recipe = create_recipe(user=self.user)
+        payload = {
+            'create': [
+                {'title': 'Valid', 'time_minutes': 5, 'price': '1.00'},
+                {'title': 'Missing fields'},
+            ],
+            'delete': [recipe.id],
+        }
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['create'][0], {})
+        self.assertIn('time_minutes', res.data['create'][1])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_other_users_recipe_not_found(self):
+        """Test a batch cannot touch another user's recipes."""
+        other_user = create_user(email='other@example.com', password='pw1234')
+        recipe = create_recipe(user=other_user)
+
+        payload = {
+            'update': [{'id': recipe.id, 'title': 'Hijacked'}],
+            'delete': [recipe.id],
+        }
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        recipe.refresh_from_db()
+        self.assertNotEqual(recipe.title, 'Hijacked')
+
+    def test_bulk_ignores_list_filters(self):
+        """Test list filters in the URL don't hide the user's recipes."""
+        recipe = create_recipe(user=self.user, title='Untagged')
+        tag = Tag.objects.create(user=self.user, name='Other')
+
+        payload = {'update': [{'id': recipe.id, 'title': 'Renamed'}]}
+        res = self.client.post(
+            f'{BULK_URL}?tags={tag.id}&search=nothing', payload,
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Renamed')
+
+
+class ExportRecipeApiTests(TestCase):
+    """Test streaming recipe exports."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipes = [create_recipe(user=self.user) for _ in range(3)]
+        self.recipes[0].tags.add(
+            Tag.objects.create(user=self.user, name='Spicy'),
+        )
+        create_recipe(user=create_user(email='o@example.com', password='pw'))
+
+    def _content(self, res):
+        """Return the decoded body of a streaming response."""
+        self.assertTrue(res.streaming)
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Test exporting recipes as one JSON document per line."""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        items = [json.loads(line) for line in self._content(res).splitlines()]
+        self.assertEqual(
+            [item['id'] for item in items],
+            [r.id for r in reversed(self.recipes)],
+        )
+        self.assertEqual(items[-1]['tags'][0]['name'], 'Spicy')
+
+    def test_export_csv(self):
+        """Test exporting recipes as CSV."""
+        res = self.client.get(EXPORT_URL, {'export_format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = list(csv.DictReader(io.StringIO(self._content(res))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[-1]['tags'], 'Spicy')
+
+    def test_export_chunks_use_constant_queries(self):
+        """Test relations are prefetched per chunk, not per recipe."""
+        with CaptureQueriesContext(connection) as ctx:
+            self._content(self.client.get(EXPORT_URL))
+        few = len(ctx.captured_queries)
+        for _ in range(10):
+            create_recipe(user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self._content(self.client.get(EXPORT_URL))
+
+        self.assertEqual(few, len(ctx.captured_queries))
+
+    def test_export_invalid_format(self):
+        """Test unknown export formats are rejected."""
+        res = self.client.get(EXPORT_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PantryRecipeApiTests(TestCase):
+    """Test ranking recipes by pantry coverage."""
+
+    def setUp(self):
+        cache.clear()
+        pantry_indexes.clear()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Eggs', 'Flour', 'Milk', 'Sugar')
+        }
+
+    def _recipe(self, title, *names):
+        recipe = create_recipe(user=self.user, title=title)
+        recipe.ingredients.add(*[self.ingredients[name] for name in names])
+        return recipe
+
+    def _pantry(self, *names, **params):
+        params['ingredients'] = ','.join(
+            str(self.ingredients[name].id) for name in names
+        )
+        res = self.client.get(PANTRY_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(item['title'], item['coverage']) for item in res.data]
+
+    def test_ranked_by_coverage(self):
+        """Test recipes mostly covered by the pantry come first."""
+        self._recipe('Pancakes', 'Eggs', 'Flour', 'Milk')
+        self._recipe('Omelette', 'Eggs')
+        self._recipe('Cake', 'Eggs', 'Flour', 'Milk', 'Sugar')
+
+        results = self._pantry('Eggs', 'Flour', 'Milk', min_coverage=0)
+
+        self.assertEqual(results, [
+            ('Pancakes', 1.0), ('Omelette', 1.0), ('Cake', 0.75),
+        ])
+
+    def test_min_coverage(self):
+        """Test recipes below the threshold are left out."""
+        self._recipe('Pancakes', 'Eggs', 'Flour', 'Milk')
+        self._recipe('Cake', 'Eggs', 'Flour', 'Milk', 'Sugar')
+
+        results = self._pantry('Eggs', 'Sugar', min_coverage=0.5)
+
+        self.assertEqual(results, [('Cake', 0.5)])
+
+    def test_index_follows_changes(self):
+        """Test added, removed and deleted links are reflected."""
+        pancakes = self._recipe('Pancakes', 'Eggs', 'Flour')
+        omelette = self._recipe('Omelette', 'Eggs')
+        self._pantry('Eggs')
+
+        # index changes are applied once the writes commit
+        with self.captureOnCommitCallbacks(execute=True):
+            pancakes.ingredients.remove(self.ingredients['Flour'])
+            omelette.delete()
+
+        self.assertEqual(self._pantry('Eggs'), [('Pancakes', 1.0)])
+
+    def test_soft_deleted_recipe_not_matched(self):
+        """Test a recipe deleted through the API leaves the index."""
+        self._recipe('Pancakes', 'Eggs', 'Flour')
+        omelette = self._recipe('Omelette', 'Eggs')
+        self._pantry('Eggs')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail_url(omelette.id))
+
+        self.assertEqual(self._pantry('Eggs'), [('Pancakes', 0.5)])
+
+    def test_invalid_params(self):
+        """Test malformed parameters are rejected."""
+        for params in ({}, {'ingredients': 'a,b'},
+                       {'ingredients': '1', 'min_coverage': 'x'}):
+            res = self.client.get(PANTRY_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SimilarRecipeApiTests(TestCase):
+    """Test ranking recipes by shared tags and ingredients."""
+
+    def setUp(self):
+        cache.clear()
+        similarity_indexes.clear()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+
+    def _similar(self, recipe, **params):
+        res = self.client.get(similar_url(recipe.id), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(item['title'], item['similarity']) for item in res.data]
+
+    def test_ranked_by_overlap(self):
+        """Test recipes sharing more features rank higher."""
+        bowl = create_recipe(user=self.user, title='Bowl')
+        bowl.tags.add(self.vegan)
+        bowl.ingredients.add(self.rice, self.tofu)
+        stir_fry = create_recipe(user=self.user, title='Stir fry')
+        stir_fry.tags.add(self.vegan)
+        stir_fry.ingredients.add(self.tofu)
+        risotto = create_recipe(user=self.user, title='Risotto')
+        risotto.ingredients.add(self.rice)
+        create_recipe(user=self.user, title='Toast')
+
+        self.assertEqual(self._similar(bowl), [
+            ('Stir fry', round(2 / 3, 4)), ('Risotto', round(1 / 3, 4)),
+        ])
+        self.assertEqual(self._similar(bowl, metric='cosine', limit=1), [
+            ('Stir fry', round(2 / 6 ** 0.5, 4)),
+        ])
+
+    def test_other_users_recipe_not_found(self):
+        """Test similar recipes of another user's recipe are not exposed."""
+        other = create_user(email='other@example.com', password='test123')
+        recipe = create_recipe(user=other)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_metric(self):
+        """Test an unknown metric is rejected."""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(similar_url(recipe.id), {'metric': 'euclid'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
 
     def setUp(self):
+        # uploads go to a throwaway media root
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             email='user@example.com',
@@ -404,7 +987,7 @@ class ImageUploadTests(TestCase):
 # similar to setup that runs after test...it deletes image after uploading
 # so there is no test image on system
     def tearDown(self):
-        self.recipe.image.delete()
+        shutil.rmtree(self.media_root, ignore_errors=True)
 
     def test_upload_image(self):
         """Test uploading image to a recipe"""
@@ -433,3 +1016,98 @@ class ImageUploadTests(TestCase):
         payload = {'image': 'notanimage'}
         res = self.client.post(url, payload, format='multipart')
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_EAGER=True)
+    def test_upload_generates_variants(self):
+        """Test resized variants are stored and listed on the detail."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (2000, 1000)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    url, {'image': image_file}, format='multipart',
+                )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        variants = res.data['image_variants']
+        self.assertEqual(set(variants), {'thumb', 'small', 'medium'})
+        self.assertEqual(set(variants['thumb']), {'webp', 'jpg'})
+        self.assertTrue(variants['thumb']['webp'].startswith('http'))
+        self.recipe.refresh_from_db()
+        path = self.recipe.image_variants['thumb']['jpg']
+        with Image.open(default_storage.path(path)) as thumb:
+            self.assertEqual(thumb.size, (160, 80))
+
+    def test_upload_queues_variants_job(self):
+        """Test variants are rendered by a queued job."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (600, 300)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            self.client.post(url, {'image': image_file}, format='multipart')
+        self.recipe.refresh_from_db()
+        job = Job.objects.get(name='recipe.image_variants')
+        self.assertEqual(job.payload, {
+            'recipe_id': self.recipe.id, 'image_name': self.recipe.image.name,
+        })
+
+        self.assertTrue(jobs.run_job(jobs.claim('worker')))
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            set(self.recipe.image_variants), {'thumb', 'small', 'medium'},
+        )
+
+    def test_upload_clears_old_variants(self):
+        """Test a new upload drops the previous image's variants."""
+        self.recipe.image_variants = {'thumb': {'jpg': 'old/thumb.jpg'}}
+        self.recipe.save()
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            self.client.post(url, {'image': image_file}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+    def _post_image(self, image, image_format='PNG'):
+        with tempfile.NamedTemporaryFile(suffix='.img') as image_file:
+            image.save(image_file, format=image_format)
+            image_file.seek(0)
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+
+    @override_settings(UPLOAD_MAX_BYTES=1024)
+    def test_upload_too_large(self):
+        """Test uploads over the size limit are rejected with 413."""
+        noise = Image.frombytes('L', (300, 300), os.urandom(300 * 300))
+
+        res = self._post_image(noise)
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_unsupported_format(self):
+        """Test image formats outside the allowed list are rejected."""
+        res = self._post_image(Image.new('RGB', (10, 10)), 'GIF')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10_000)
+    def test_upload_dimensions_checked_without_decoding(self):
+        """Test oversized images are rejected from the header alone."""
+        with patch('PIL.ImageFile.ImageFile.load') as load:
+            res = self._post_image(Image.new('L', (200, 200)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        load.assert_not_called()
@@ -0,0 +1,112 @@
+"""
+Tests for reading recipe data from a read replica.
+"""
+import json
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, using='default', **params):
+    """Create and return a sample recipe in the given database."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.using(using).create(user=user, **defaults)
+
+
+@skipUnless('test_replica' in settings.DATABASES, 'needs DB_TEST_REPLICA')
+@override_settings(DATABASE_REPLICAS=['test_replica'])
+class ReplicaReadTests(TestCase):
+    """Test safe requests read from the replica and writes pin the user."""
+    # rows created on only one side show where a read went
+    databases = '__all__'
+
+    def setUp(self):
+        self.replica = 'test_replica'
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.user.save(using=self.replica)
+        create_recipe(self.user, title='On primary')
+        create_recipe(self.user, using=self.replica, title='On replica')
+        # drop the pin the writes above left
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _recipe_titles(self):
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in res.data['results']]
+
+    def test_list_reads_replica(self):
+        """Test listing recipes reads from the replica."""
+        self.assertEqual(self._recipe_titles(), ['On replica'])
+
+    def test_export_reads_replica(self):
+        """Test a streamed export reads from the replica while sent."""
+        res = self.client.get(EXPORT_URL)
+
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['title'] for line in lines], ['On replica'],
+        )
+
+    def test_tags_read_replica(self):
+        """Test the recipe attribute views read from the replica."""
+        Tag.objects.using(self.replica).create(user=self.user, name='Vegan')
+        cache.clear()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']], ['Vegan'],
+        )
+
+    def test_write_then_read_uses_primary(self):
+        """Test a user reads their own write right after making it."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Just added',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertCountEqual(
+            self._recipe_titles(), ['On primary', 'Just added'],
+        )
+
+    def test_background_write_pins_user(self):
+        """Test a write outside a request also keeps reads on the primary."""
+        create_recipe(self.user, title='From a worker')
+
+        self.assertCountEqual(
+            self._recipe_titles(), ['On primary', 'From a worker'],
+        )
+
+    def test_pin_expires(self):
+        """Test reads go back to the replica after the pin window."""
+        with self.settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            create_recipe(self.user, title='From a worker')
+
+        self.assertEqual(self._recipe_titles(), ['On replica'])
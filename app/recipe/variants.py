@@ -0,0 +1,69 @@
+"""
+Background generation of recipe image variants
+"""
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from core.jobs import enqueue, register
+from core.models import Recipe
+from recipe.images import render_variants
+
+
+def variants_dir(image_name):
+    """Return the storage directory of an image's variants."""
+    root, _ = os.path.splitext(image_name)
+    directory, filename = os.path.split(root)
+    return os.path.join(directory, 'variants', filename)
+
+
+def store_variants(recipe_id, image_name, rendered):
+    """Save rendered variants and record them on the recipe."""
+    directory = variants_dir(image_name)
+    variants = {}
+    for name, files in rendered.items():
+        variants[name] = {}
+        for extension, content in files.items():
+            variants[name][extension] = default_storage.save(
+                os.path.join(directory, f'{name}.{extension}'),
+                ContentFile(content),
+            )
+    # a newer upload replaces the image; its own job records its variants
+    with transaction.atomic():
+        # a deleted recipe still records them, the purge releases them
+        recipe = Recipe.all_objects.select_for_update().filter(
+            id=recipe_id, image=image_name,
+        ).first()
+        if recipe is not None:
+            recipe.image_variants = variants
+            # save() moves the blob references to the new variants
+            recipe.save(update_fields=['image_variants'])
+    return variants
+
+
+@register('recipe.image_variants', priority=10)
+def generate_variants(recipe_id, image_name):
+    """Render and store the variants of a recipe image."""
+    path = default_storage.path(image_name)
+    return store_variants(recipe_id, image_name, render_variants(path))
+
+
+def schedule_variants(recipe):
+    """Generate the variants of a recipe's image once it is committed.
+
+    They are rendered by the job queue workers unless RECIPE_IMAGE_EAGER
+    is set.
+    """
+    recipe_id, image_name = recipe.id, recipe.image.name
+    if settings.RECIPE_IMAGE_EAGER:
+        transaction.on_commit(
+            lambda: generate_variants(recipe_id, image_name)
+        )
+    else:
+        # the job commits, or rolls back, with the upload
+        enqueue('recipe.image_variants', {
+            'recipe_id': recipe_id, 'image_name': image_name,
+        })
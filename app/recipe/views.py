@@ -1,6 +1,27 @@
 """
 Views for recipe APIs
 """
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db import connections, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Cast
+from django.http import StreamingHttpResponse
 from rest_framework import (
     viewsets,
     mixins,
@@ -13,16 +34,47 @@ from drf_spectacular.utils import (
     OpenApiTypes,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core.jobs import enqueue
 from core.models import (
     Recipe,
     Tag,
     Ingredient,
     )
-from recipe import serializers
+from recipe import exports, serializers
+from recipe.indexes import pantry_indexes, record_change, similarity_indexes
+from recipe.cache import (
+    CachedListMixin,
+    ConditionalGetMixin,
+    bump_version,
+)
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+)
+from recipe.variants import schedule_variants
+
+
+# aliases whose database has the pg_trgm extension installed
+_trigram_enabled = {}
+
+
+def has_trigram(alias):
+    """Return True when the database supports trigram matching."""
+    if alias not in _trigram_enabled:
+        connection = connections[alias]
+        enabled = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                )
+                enabled = cursor.fetchone() is not None
+        _trigram_enabled[alias] = enabled
+    return _trigram_enabled[alias]
 
 
 # extend_schema_view allows us to extend auto-generated schema
@@ -46,22 +98,53 @@ from recipe import serializers
                 OpenApiTypes.STR,
                 description='Comma separated list of ingredient IDs to filter',
             ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR,
+                enum=['any', 'all'],
+                description='Return recipes with any (default) or all '
+                            'of the tags and ingredients.',
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Full text search over title and description, '
+                            'results ranked by relevance.',
+            ),
         ],
     ),
 )
 # ModelViewSet is set up to specifically work for models
 # (CRUD: it automatically gets API endpoints)
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+        ConditionalGetMixin,
+        CachedListMixin,
+        viewsets.ModelViewSet):
     """View for manage recipe APIs."""
 # RecipeDetailSerializer to get details of recipes by ids to update or create
     serializer_class = serializers.RecipeDetailSerializer
 # to specify which model to work with we have to specify queryset
     queryset = Recipe.objects.all()
-# users need to authenticate using a token
-# How the user authenticates (via token)
-    authentication_classes = [TokenAuthentication]
+# users authenticate with a token through the default
+# CachedTokenAuthentication set in REST_FRAMEWORK settings
 # only authenticated users can access the API
     permission_classes = [IsAuthenticated]
+# list responses are returned in pages addressed by an opaque cursor
+    pagination_class = RecipeCursorPagination
+# actions whose response includes the nested tags and ingredients
+    prefetch_actions = ('list', 'retrieve', 'update', 'partial_update')
+# how the tags and ingredients filters combine several ids
+    match_modes = ('any', 'all')
+# pantry matches returned by default and at most
+    pantry_limit = 20
+    pantry_max_limit = 100
+# similar recipes returned by default and at most
+    similar_limit = 10
+    similar_max_limit = 100
+# measures the similar recipes can be ranked by
+    similarity_metrics = ('jaccard', 'cosine')
+# safe requests read from a replica, see core.db.routers
+    read_from_replica = True
 
     def _params_to_ints(self, qs):
         """Convert a list of integers."""
@@ -73,28 +156,79 @@ class RecipeViewSet(viewsets.ModelViewSet):
 # This checks if the user added tags or ingredients in the URL
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
 # self.queryset contains all recipes in the database.
         queryset = self.queryset
+        if search:
+            queryset = self._search(queryset, search)
+        match = self.request.query_params.get('match', 'any')
+        if match not in self.match_modes:
+            raise ValidationError(
+                {'match': [f'Must be one of: {", ".join(self.match_modes)}.']}
+            )
 # _params_to_ints converts a comma-separated string into a list of integers
         if tags:
-            tag_ids = self._params_to_ints(tags)
-# tags__id__in is a Django ORM filter lookup expression
-# used to filter records based on a list of tag IDs
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_related(
+                queryset, 'tags', self._params_to_ints(tags), match,
+            )
         if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = self._filter_related(
+                queryset, 'ingredients', self._params_to_ints(ingredients),
+                match,
+            )
 # Filters the results so that only recipes
 # created by the logged-in user are returned
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
-                               ).order_by('-id').distinct()
+                               ).order_by('-id')
+        return self._prefetch_for_action(queryset)
+
+    def _filter_related(self, queryset, relation, ids, match):
+        """Filter recipes linked to any or all of the related ids."""
+# EXISTS probes the through table's (recipe, related) unique index for
+# each recipe, so recipes are never repeated and need no DISTINCT, and
+# the (user, -id) index can still return them in page order
+        through = getattr(Recipe, relation).through
+        field = Recipe._meta.get_field(relation).m2m_reverse_field_name()
+        links = through.objects.filter(recipe_id=OuterRef('pk'))
+        if match == 'any':
+            return queryset.filter(
+                Exists(links.filter(**{f'{field}__in': ids}))
+            )
+# one EXISTS per id intersects the sets without a join per id
+        for related_id in set(ids):
+            queryset = queryset.filter(
+                Exists(links.filter(**{field: related_id}))
+            )
+        return queryset
+
+    def _search(self, queryset, terms):
+        """Filter recipes matching the search terms, ranked on Postgres."""
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(title__icontains=terms) | Q(description__icontains=terms)
+            )
+# websearch syntax accepts user input like: pasta -cheese "tomato sauce"
+        query = SearchQuery(terms, config='english', search_type='websearch')
+# the GIN index on search_vector answers the @@ match; rank is cast to
+# double so cursor positions round-trip exactly
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        )
+
+    def _prefetch_for_action(self, queryset):
+        """Prefetch the relations the action's serializer renders."""
+# actions that render tags and ingredients load them in one query
+# per relation instead of two extra queries per recipe (N+1)
+        if self.action in self.prefetch_actions:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        return queryset
 
     def get_serializer_class(self):
         """Return the serializer class for requests."""
 # if action is list then call RecipeSerializer
 # else call RecipeDetailSerializer
-        if self.action == 'list':
+        if self.action in ('list', 'pantry', 'similar'):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
@@ -104,6 +238,216 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Mark the recipe deleted and queue the job removing it."""
+# a cascading delete would load and lock every related row in the request
+        pk = instance.pk
+        with transaction.atomic():
+            Recipe.objects.filter(pk=pk).soft_delete()
+            enqueue('core.purge_recipes', {'ids': [pk]})
+        record_change(instance.user_id, lambda index: index.remove_recipe(pk))
+
+# The URL for this action will be: /api/recipe/recipes/bulk/
+# creates, updates and deletes many recipes in a single transaction
+    @extend_schema(request=serializers.RecipeBulkSerializer)
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Apply a batch of recipe creates, updates and deletes."""
+        batch = serializers.RecipeBulkSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+        creates = batch.validated_data['create']
+        updates = batch.validated_data['update']
+        deletes = batch.validated_data['delete']
+
+# one query loads every recipe the batch touches; not through
+# get_queryset(), whose list filters would hide the user's other recipes
+        recipes = self.queryset.filter(user=request.user).in_bulk(
+            [item['id'] for item in updates] + deletes
+        )
+        errors = {}
+        missing = [{'id': ['Not found.']} if item['id'] not in recipes else {}
+                   for item in updates]
+        if any(missing):
+            errors['update'] = missing
+        missing = [['Not found.'] if pk not in recipes else []
+                   for pk in deletes]
+        if any(missing):
+            errors['delete'] = missing
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        create_serializer = self.get_serializer(data=creates, many=True)
+        update_serializer = self.get_serializer(
+            [recipes[item['id']] for item in updates],
+            data=updates,
+            many=True,
+            partial=True,
+        )
+        if not create_serializer.is_valid():
+            errors['create'] = create_serializer.errors
+        if not update_serializer.is_valid():
+            errors['update'] = update_serializer.errors
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            created = create_serializer.save(user=request.user)
+            updated = update_serializer.save()
+            Recipe.objects.filter(id__in=deletes).soft_delete()
+            if deletes:
+                enqueue('core.purge_recipes', {'ids': deletes})
+# bulk inserts, updates and soft deletes don't send model signals, and
+# the through rows go in with bulk_create, so m2m_changed doesn't fire
+# either; the bump expires the cached lists and the in-process indexes
+            bump_version(request.user.id)
+# load tags and ingredients of every returned recipe in two queries
+        prefetch_related_objects(created + updated, 'tags', 'ingredients')
+
+        return Response({
+            'create': create_serializer.data,
+            'update': update_serializer.data,
+            'delete': deletes,
+        }, status=status.HTTP_200_OK)
+
+# The URL for this action will be: /api/recipe/recipes/export/
+# streams every recipe so memory use does not grow with the account size
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'export_format',
+                OpenApiTypes.STR,
+                enum=list(exports.FORMATS),
+                description='Export format, ndjson (default) or csv.',
+            ),
+        ],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR},
+    )
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream the user's recipes as NDJSON or CSV."""
+# 'format' is reserved by DRF for choosing the renderer
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in exports.FORMATS:
+            return Response(
+                {'export_format': [f'Unsupported format {export_format}.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        rows, content_type = exports.FORMATS[export_format]
+        response = StreamingHttpResponse(
+            rows(self.get_queryset(), self.get_serializer_context()),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{export_format}"'
+        )
+        return response
+
+# The URL for this action will be: /api/recipe/recipes/pantry/
+# ranks recipes by the share of their ingredients found in the pantry
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated list of ingredient IDs '
+                            'in the pantry.',
+            ),
+            OpenApiParameter(
+                'min_coverage',
+                OpenApiTypes.FLOAT,
+                description='Smallest share of a recipe\'s ingredients '
+                            'the pantry must cover, 0 to 1 (default 0.5).',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of recipes to return, up to 100.',
+            ),
+        ],
+    )
+    @action(methods=['GET'], detail=False, url_path='pantry')
+    def pantry(self, request):
+        """Return the recipes best covered by the given ingredients."""
+        return self._cached(self._pantry, request)
+
+    def _pantry(self, request):
+        params = request.query_params
+        try:
+            ingredient_ids = self._params_to_ints(params['ingredients'])
+            min_coverage = float(params.get('min_coverage', 0.5))
+            limit = int(params.get('limit', self.pantry_limit))
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': 'ingredients must be a comma separated list of '
+                           'IDs, min_coverage a number and limit an integer.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, self.pantry_max_limit))
+# the in-process index ranks without touching the through table;
+# only the returned recipes are loaded
+        ranked = pantry_indexes.rank(
+            request.user.id, ingredient_ids, min_coverage, limit,
+        )
+        return Response(self._ranked_recipes(ranked, 'coverage'))
+
+    def _ranked_recipes(self, ranked, score_name):
+        """Serialize [(recipe id, score)] in order with their scores."""
+        recipes = self.queryset.filter(
+            user=self.request.user,
+            id__in=[recipe_id for recipe_id, _ in ranked],
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+        results = []
+        for recipe_id, score in ranked:
+            if recipe_id in recipes:
+                data = self.get_serializer(recipes[recipe_id]).data
+                data[score_name] = round(score, 4)
+                results.append(data)
+        return results
+
+# The URL for this action will be: /api/recipe/recipes/{id}/similar/
+# ranks the user's other recipes by shared tags and ingredients
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'metric',
+                OpenApiTypes.STR,
+                enum=list(similarity_metrics),
+                description='Similarity measure, jaccard (default) '
+                            'or cosine.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of recipes to return, up to 100.',
+            ),
+        ],
+    )
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """Return the recipes most similar to this one."""
+        return self._cached(self._similar, request, pk=pk)
+
+    def _similar(self, request, pk=None):
+        params = request.query_params
+        metric = params.get('metric', 'jaccard')
+        try:
+            limit = int(params.get('limit', self.similar_limit))
+        except ValueError:
+            limit = None
+        if metric not in self.similarity_metrics or limit is None:
+            return Response(
+                {'detail': 'metric must be jaccard or cosine and limit '
+                           'an integer.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, self.similar_max_limit))
+        recipe = self.get_object()
+# the sparse matrix scores every recipe against this one at once
+        ranked = similarity_indexes.rank(
+            request.user.id, recipe.id, metric, limit,
+        )
+        return Response(self._ranked_recipes(ranked, 'similarity'))
+
 # The URL for this action will be: /api/recipes/{id}/upload_image/
 # where {id} is the recipe’s ID.
     @action(methods=['POST'], detail=True, url_path='upload_image')
@@ -115,7 +459,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            # the old image's variants no longer apply; the new ones are
+            # rendered in the background once the upload commits
+            recipe = serializer.save(image_variants={})
+            schedule_variants(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -136,21 +483,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 ),
             ],
         ),
+        typeahead=extend_schema(
+            parameters=[
+                OpenApiParameter(
+                    'q',
+                    OpenApiTypes.STR,
+                    description='Text typed so far; prefix is an alias.',
+                ),
+                OpenApiParameter(
+                    'limit',
+                    OpenApiTypes.INT,
+                    description='Number of matches to return, up to 50.',
+                ),
+            ],
+        ),
 )
 # (CRUD: it automatically gets API endpoints)
 # ListModelMixin allows to add mixin functionality
 # GenericViewSet should be the last thing in definitions
 class BaseRecipeAttrViewSet(
+                CachedListMixin,
                 mixins.DestroyModelMixin,
                 mixins.UpdateModelMixin,
                 mixins.ListModelMixin,
                 viewsets.GenericViewSet):
     """Base viewset for recipe attributes"""
-# users need to authenticate using a token
-# How the user authenticates (via token)
-    authentication_classes = [TokenAuthentication]
+# users authenticate with a token through the default
+# CachedTokenAuthentication set in REST_FRAMEWORK settings
 # only authenticated users can access the API
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+# typeahead returns the top matches only, never a full page
+    typeahead_limit = 10
+    typeahead_max_limit = 50
+# safe requests read from a replica, see core.db.routers
+    read_from_replica = True
 
     def get_queryset(self):
         """Filter queryset to authenticated user."""
@@ -166,12 +533,65 @@ class BaseRecipeAttrViewSet(
         queryset = self.queryset
 # Only include tags that are assigned to a recipe.
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.filter(
+                recipe__isnull=False, recipe__deleted_at__isnull=True,
+            ).distinct()
 # filters the tags to only show those that belong
 # to the currently logged-in user.
         return queryset.filter(
             user=self.request.user
-            ).order_by('-name').distinct()
+            ).order_by('-name')
+
+# The URL for this action will be e.g. /api/recipe/ingredients/typeahead/
+# called on every keystroke, so it is cached like the list responses
+    @action(methods=['GET'], detail=False, url_path='typeahead')
+    def typeahead(self, request):
+        """Return the best name matches for the text typed so far."""
+        return self._cached(self._typeahead, request)
+
+    def _typeahead(self, request):
+        params = request.query_params
+        term = (params.get('q') or params.get('prefix') or '').strip()
+        try:
+            limit = int(params.get('limit', self.typeahead_limit))
+        except ValueError:
+            return Response(
+                {'limit': ['A valid integer is required.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, self.typeahead_max_limit))
+        if not term:
+            return Response([])
+        queryset = self._match_names(
+            self.queryset.filter(user=request.user), term,
+        )
+        serializer = self.get_serializer(queryset[:limit], many=True)
+        return Response(serializer.data)
+
+    def _match_names(self, queryset, term):
+        """Filter names matching term, best matches first."""
+# prefix matches rank first and are answered by the
+# (user, UPPER(name)) index; usage is how many recipes use the name
+        prefix = Q(name__istartswith=term)
+        queryset = queryset.annotate(
+            is_prefix=Case(
+                When(prefix, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            usage=Count(
+                'recipe', filter=Q(recipe__deleted_at__isnull=True),
+            ),
+        )
+        if not has_trigram(queryset.db):
+            return queryset.filter(prefix | Q(name__icontains=term)).order_by(
+                '-is_prefix', '-usage', 'name',
+            )
+# the trigram GIN index also finds misspelled names ('tomatoe')
+        queryset = queryset.filter(prefix | Q(name__trigram_similar=term))
+        return queryset.annotate(
+            similarity=TrigramSimilarity('name', term),
+        ).order_by('-is_prefix', '-similarity', '-usage', 'name')
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
@@ -170,3 +171,41 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_user_closes_account(self):
+        """Test deleting the profile deactivates the user at once."""
+        Token.objects.create(user=self.user)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_update_keeps_changes_made_since_authentication(self):
+        """Test an update starts from the current row, not a cached user."""
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            password='changed',
+        )
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Updated name')
+        self.assertEqual(self.user.password, 'changed')
+
+    def test_update_closed_account_not_found(self):
+        """Test a stale copy of a closed account can't reopen it."""
+        self.user.soft_delete()
+        self.user.is_active = True
+        self.user.deleted_at = None
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
@@ -2,11 +2,18 @@
 Views for the user API
 """
 
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from rest_framework import generics, permissions
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.settings import api_settings
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 
 
+from core.jobs import enqueue
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -26,14 +33,28 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user."""
     # print("hitttttttttttttttttt")
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """Retrieve and return authenticated user while printing tokens."""
-
-        return self.request.user
+        if self.request.method in SAFE_METHODS:
+            return self.request.user
+        # the authenticated user may come from the token cache; saving
+        # that copy would undo a password change or account closure made
+        # since, so writes start from the current row
+        return get_object_or_404(
+            get_user_model(), pk=self.request.user.pk,
+            is_active=True, deleted_at__isnull=True,
+        )
+
+    def perform_destroy(self, instance):
+        """Close the account and queue the job removing its data."""
+        with transaction.atomic():
+            instance.soft_delete()
+            # the tokens go now so the account is signed out everywhere
+            Token.objects.filter(user=instance).delete()
+            enqueue('core.purge_user', {'user_id': instance.pk})